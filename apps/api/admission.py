@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+from .errors import ApiError
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class TokenBucket:
+    tokens: float
+    updated_at: float
+
+
+# Scheduler work runs on its own executor so a burst of generate calls cannot
+# occupy the threadpool shared by the CRUD endpoints. Requests beyond
+# max_concurrency wait in a queue of at most max_queue entries; past that they
+# are rejected with 503. Each client also has a token bucket refilled at
+# rate_per_minute up to burst, and an empty bucket is rejected with 429. The
+# queue is checked first, so a request turned away with 503 spends no token. All
+# bookkeeping happens on the event loop thread, so it needs no locking.
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        rate_per_minute: float,
+        burst: int,
+        max_clients: int = 10000,
+    ) -> None:
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._rate = rate_per_minute / 60
+        self._burst = burst
+        self._max_clients = max_clients
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._pending = 0
+        self._average_seconds = 0.0
+        self._admitted = 0
+        self._rejected_rate_limited = 0
+        self._rejected_overloaded = 0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self._max_concurrency,
+            "max_queue": self._max_queue,
+            "running": min(self._pending, self._max_concurrency),
+            "queue_depth": max(0, self._pending - self._max_concurrency),
+            "admitted": self._admitted,
+            "rejected_rate_limited": self._rejected_rate_limited,
+            "rejected_overloaded": self._rejected_overloaded,
+            "average_seconds": round(self._average_seconds, 4),
+        }
+
+    def _take_token(self, client: str) -> None:
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(tokens=self._burst, updated_at=now)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self._max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket.tokens = min(self._burst, bucket.tokens + (now - bucket.updated_at) * self._rate)
+            bucket.updated_at = now
+        if bucket.tokens < 1:
+            self._rejected_rate_limited += 1
+            retry_after = math.ceil((1 - bucket.tokens) / self._rate) if self._rate > 0 else 60
+            raise ApiError(
+                status_code=429,
+                message_id="E-0429",
+                message="リクエストが多すぎます。しばらくしてから再度お試しください",
+                headers={"Retry-After": str(retry_after)},
+            )
+        bucket.tokens -= 1
+
+    async def run(self, client: str, func: Callable[..., T], *args) -> T:
+        if self._pending >= self._max_concurrency + self._max_queue:
+            self._rejected_overloaded += 1
+            waves = math.ceil((self._pending - self._max_concurrency + 1) / self._max_concurrency)
+            retry_after = max(1, math.ceil(waves * self._average_seconds))
+            raise ApiError(
+                status_code=503,
+                message_id="E-0503",
+                message="混雑しています。しばらくしてから再度お試しください",
+                headers={"Retry-After": str(retry_after)},
+            )
+        self._take_token(client)
+        self._pending += 1
+        self._admitted += 1
+        started_at = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            elapsed = time.monotonic() - started_at
+            self._average_seconds += (elapsed - self._average_seconds) * 0.2
+
+
+PLAN_ADMISSION = AdmissionController(
+    "plan-generate",
+    int(os.environ.get("PLAN_GENERATE_CONCURRENCY", "2")),
+    int(os.environ.get("PLAN_GENERATE_QUEUE", "8")),
+    float(os.environ.get("PLAN_GENERATE_RATE_PER_MINUTE", "30")),
+    int(os.environ.get("PLAN_GENERATE_BURST", "10")),
+)
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import json
+import struct
+from array import array
+from dataclasses import dataclass, replace
+from datetime import datetime, time, timedelta
+from typing import Iterable, Mapping
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+from .schemas import Plan, PlanBlock, Task
+
+
+BLOCK_KINDS = ("work", "break", "buffer")
+_KIND_CODES = {kind: code for code, kind in enumerate(BLOCK_KINDS)}
+_NO_TASK = -1
+_COMPACT_HEADER = struct.Struct("<HHII")
+
+
+def plan_base(plan: Plan) -> datetime:
+    return datetime.combine(plan.date, time.min, tzinfo=ZoneInfo(plan.timezone))
+
+
+@dataclass(slots=True)
+class CompactPlanBlocks:
+    base: datetime
+    starts: array
+    ends: array
+    kinds: bytes
+    task_refs: array
+    block_ids: bytes
+    metas: dict[int, dict] | None
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+
+def encode_compact(plan_id: str, packed: CompactPlanBlocks) -> bytes:
+    plan_id_bytes = plan_id.encode()
+    base_bytes = packed.base.isoformat().encode()
+    metas_bytes = json.dumps(packed.metas).encode() if packed.metas else b""
+    return b"".join(
+        (
+            _COMPACT_HEADER.pack(len(plan_id_bytes), len(base_bytes), len(packed), len(metas_bytes)),
+            plan_id_bytes,
+            base_bytes,
+            packed.starts.tobytes(),
+            packed.ends.tobytes(),
+            packed.kinds,
+            packed.task_refs.tobytes(),
+            packed.block_ids,
+            metas_bytes,
+        )
+    )
+
+
+def _read_column(view: memoryview, offset: int, count: int) -> tuple[array, int]:
+    column = array("i")
+    end = offset + count * column.itemsize
+    column.frombytes(view[offset:end])
+    return column, end
+
+
+def decode_compact(view: memoryview, offset: int) -> tuple[str, CompactPlanBlocks, int]:
+    plan_id_size, base_size, count, metas_size = _COMPACT_HEADER.unpack_from(view, offset)
+    offset += _COMPACT_HEADER.size
+    plan_id = bytes(view[offset : offset + plan_id_size]).decode()
+    offset += plan_id_size
+    base = datetime.fromisoformat(bytes(view[offset : offset + base_size]).decode())
+    offset += base_size
+    starts, offset = _read_column(view, offset, count)
+    ends, offset = _read_column(view, offset, count)
+    kinds = bytes(view[offset : offset + count])
+    offset += count
+    task_refs, offset = _read_column(view, offset, count)
+    block_ids = bytes(view[offset : offset + count * 16])
+    offset += count * 16
+    metas = None
+    if metas_size:
+        raw = json.loads(bytes(view[offset : offset + metas_size]))
+        metas = {int(index): meta for index, meta in raw.items()}
+    offset += metas_size
+    packed = CompactPlanBlocks(
+        base=base,
+        starts=starts,
+        ends=ends,
+        kinds=kinds,
+        task_refs=task_refs,
+        block_ids=block_ids,
+        metas=metas,
+    )
+    return plan_id, packed, offset
+
+
+# Blocks are kept per plan as parallel arrays: second offsets from the plan's
+# local midnight, kind codes, indexes into a store-wide task table and packed
+# 16-byte UUIDs. Titles are joined from the task mapping when materializing; the
+# task table keeps the last title a block was stored with, for tasks that have
+# since been deleted. Table entries are reference counted by stored blocks and
+# their slots reused once no plan points at them.
+class PlanBlockStore:
+    def __init__(self, tasks: Mapping[str, Task]) -> None:
+        self._tasks = tasks
+        self._plans: dict[str, CompactPlanBlocks] = {}
+        self._task_table: list[tuple[str, str | None] | None] = []
+        self._task_refs: dict[str, int] = {}
+        self._ref_counts: list[int] = []
+        self._free_refs: list[int] = []
+        self._block_count = 0
+
+    def __contains__(self, plan_id: object) -> bool:
+        return plan_id in self._plans
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    @property
+    def block_count(self) -> int:
+        return self._block_count
+
+    def _task_ref(self, task_id: str | None, title: str | None) -> int:
+        if task_id is None:
+            return _NO_TASK
+        ref = self._task_refs.get(task_id)
+        if ref is None:
+            if self._free_refs:
+                ref = self._free_refs.pop()
+            else:
+                ref = len(self._task_table)
+                self._task_table.append(None)
+                self._ref_counts.append(0)
+            self._task_refs[task_id] = ref
+        elif title is None:
+            title = self._task_table[ref][1]
+        self._task_table[ref] = (task_id, title)
+        return ref
+
+    def _retain(self, packed: CompactPlanBlocks) -> None:
+        for ref in packed.task_refs:
+            if ref != _NO_TASK:
+                self._ref_counts[ref] += 1
+
+    def _release(self, packed: CompactPlanBlocks) -> None:
+        for ref in packed.task_refs:
+            if ref == _NO_TASK:
+                continue
+            self._ref_counts[ref] -= 1
+            if not self._ref_counts[ref]:
+                task_id, _ = self._task_table[ref]
+                del self._task_refs[task_id]
+                self._task_table[ref] = None
+                self._free_refs.append(ref)
+
+    def pack(self, base: datetime, blocks: list[PlanBlock]) -> CompactPlanBlocks:
+        starts = array("i")
+        ends = array("i")
+        kinds = bytearray()
+        task_refs = array("i")
+        block_ids = bytearray()
+        metas: dict[int, dict] = {}
+        for index, block in enumerate(blocks):
+            starts.append(int((block.start_at - base).total_seconds()))
+            ends.append(int((block.end_at - base).total_seconds()))
+            kinds.append(_KIND_CODES[block.kind])
+            task_refs.append(self._task_ref(block.task_id, block.task_title))
+            block_ids += UUID(block.block_id).bytes
+            if block.meta:
+                metas[index] = block.meta
+        return CompactPlanBlocks(
+            base=base,
+            starts=starts,
+            ends=ends,
+            kinds=bytes(kinds),
+            task_refs=task_refs,
+            block_ids=bytes(block_ids),
+            metas=metas or None,
+        )
+
+    def unpack(
+        self,
+        plan_id: str,
+        packed: CompactPlanBlocks,
+        task_table: list | None = None,
+    ) -> list[PlanBlock]:
+        task_table = self._task_table if task_table is None else task_table
+        blocks: list[PlanBlock] = []
+        for index in range(len(packed)):
+            ref = packed.task_refs[index]
+            task_id = title = None
+            if ref != _NO_TASK:
+                task_id, title = task_table[ref]
+                task = self._tasks.get(task_id)
+                if task is not None:
+                    title = task.title
+            meta = packed.metas.get(index) if packed.metas else None
+            blocks.append(
+                PlanBlock.model_construct(
+                    block_id=str(UUID(bytes=packed.block_ids[index * 16 : index * 16 + 16])),
+                    plan_id=plan_id,
+                    start_at=packed.base + timedelta(seconds=packed.starts[index]),
+                    end_at=packed.base + timedelta(seconds=packed.ends[index]),
+                    kind=BLOCK_KINDS[packed.kinds[index]],
+                    task_id=task_id,
+                    task_title=title,
+                    meta=dict(meta) if meta else {},
+                )
+            )
+        return blocks
+
+    def localize(self, packed: CompactPlanBlocks) -> tuple[CompactPlanBlocks, list[tuple[str, str | None]]]:
+        task_table: list[tuple[str, str | None]] = []
+        local_refs: dict[int, int] = {}
+        task_refs = array("i")
+        for ref in packed.task_refs:
+            if ref != _NO_TASK:
+                if ref not in local_refs:
+                    local_refs[ref] = len(task_table)
+                    task_id, title = self._task_table[ref]
+                    task = self._tasks.get(task_id)
+                    task_table.append((task_id, task.title if task is not None else title))
+                ref = local_refs[ref]
+            task_refs.append(ref)
+        return replace(packed, task_refs=task_refs), task_table
+
+    def put(self, plan_id: str, base: datetime, blocks: list[PlanBlock]) -> None:
+        self.pop(plan_id)
+        packed = self.pack(base, blocks)
+        self._retain(packed)
+        self._plans[plan_id] = packed
+        self._block_count += len(packed)
+
+    def raw(self, plan_id: str) -> CompactPlanBlocks | None:
+        return self._plans.get(plan_id)
+
+    def get(self, plan_id: str) -> list[PlanBlock] | None:
+        packed = self._plans.get(plan_id)
+        if packed is None:
+            return None
+        return self.unpack(plan_id, packed)
+
+    def pop(self, plan_id: str) -> CompactPlanBlocks | None:
+        packed = self._plans.pop(plan_id, None)
+        if packed is not None:
+            self._release(packed)
+            self._block_count -= len(packed)
+        return packed
+
+    def items(self) -> Iterable[tuple[str, CompactPlanBlocks]]:
+        return list(self._plans.items())
+
+    def task_table(self) -> list[tuple[str, str | None] | None]:
+        return self._task_table[:]
+
+    def restore(self, task_table: list, plans: dict[str, CompactPlanBlocks]) -> None:
+        self._task_table = [tuple(entry) if entry is not None else None for entry in task_table]
+        self._task_refs = {entry[0]: ref for ref, entry in enumerate(self._task_table) if entry is not None}
+        self._ref_counts = [0] * len(task_table)
+        self._plans = plans
+        for packed in plans.values():
+            self._retain(packed)
+        self._free_refs = [ref for ref, count in enumerate(self._ref_counts) if not count]
+        for ref in self._free_refs:
+            entry = self._task_table[ref]
+            if entry is not None:
+                del self._task_refs[entry[0]]
+                self._task_table[ref] = None
+        self._block_count = sum(len(packed) for packed in plans.values())
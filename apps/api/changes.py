@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from uuid import uuid4
+
+from .storage import STORE, InMemoryStore
+
+
+# Every mutation bumps store.sequence and appends a compact record to a bounded
+# ring. Event IDs are "<epoch>-<sequence>"; the epoch changes on every process
+# start, so a cursor from before a restart, or one older than the ring, cannot
+# be resumed and the client is told to reload. Subscribers on the event loop
+# all await one shared future, which publish() resolves from whichever thread
+# made the change, so an idle stream costs nothing per connection.
+class ChangeFeed:
+    def __init__(self, store: InMemoryStore, max_records: int) -> None:
+        self._store = store
+        self._lock = threading.Lock()
+        self._records: deque[dict] = deque(maxlen=max_records)
+        self._versions: dict[tuple[str, str], int] = {}
+        self._epoch = uuid4().hex[:8]
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._waiter: asyncio.Future | None = None
+
+    @property
+    def sequence(self) -> int:
+        return self._store.sequence
+
+    def event_id(self, sequence: int) -> str:
+        return f"{self._epoch}-{sequence}"
+
+    def parse_cursor(self, event_id: str | None) -> int | None:
+        if not event_id:
+            return self.sequence
+        epoch, _, sequence = event_id.rpartition("-")
+        if epoch != self._epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def publish(self, entity: str, entity_id: str, op: str, tenant_id: str) -> None:
+        with self._lock:
+            key = (entity, entity_id)
+            if op == "delete":
+                version = self._versions.pop(key, 0) + 1
+            else:
+                version = self._versions.get(key, 0) + 1
+                self._versions[key] = version
+            sequence = self._store.sequence + 1
+            self._store.sequence = sequence
+            self._records.append(
+                {
+                    "seq": sequence,
+                    "tenant_id": tenant_id,
+                    "entity": entity,
+                    "id": entity_id,
+                    "op": op,
+                    "version": version,
+                }
+            )
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def since(self, cursor: int) -> list[dict] | None:
+        with self._lock:
+            if cursor > self._store.sequence:
+                return None
+            if cursor == self._store.sequence:
+                return []
+            if not self._records or self._records[0]["seq"] > cursor + 1:
+                return None
+            skip = cursor + 1 - self._records[0]["seq"]
+            return [self._records[index] for index in range(skip, len(self._records))]
+
+    async def wait(self, cursor: int, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        if self._store.sequence > cursor:
+            return True
+        if self._waiter is None or self._waiter.get_loop() is not loop:
+            self._waiter = loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waiter), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _wake(self) -> None:
+        waiter = self._waiter
+        self._waiter = None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+def encode_record(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":"))
+
+
+CHANGES = ChangeFeed(STORE, int(os.environ.get("CHANGE_FEED_MAX_RECORDS", "10000")))
@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import fcntl
+import gc
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import cache, partial
+from pathlib import Path
+from types import UnionType
+from typing import BinaryIO, Callable, Literal, Union, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter
+
+from .blockstore import CompactPlanBlocks, decode_compact, encode_compact, plan_base
+from .errors import ApiError
+from .schemas import Event, Plan, PlanBlock, Task
+from .storage import STORE, InMemoryStore, TenantMap
+
+
+class PlanRecord(BaseModel):
+    plan: Plan
+    blocks: list[PlanBlock]
+
+
+_KINDS = ("task", "event", "plan")
+_FRAME = struct.Struct("<IIB")
+_SNAPSHOT_MAGIC = b"LLTSNAP4"
+_SNAPSHOT_MAGIC_JSON = b"LLTSNAP1"
+_SNAPSHOT_HEADER = struct.Struct("<8sQ")
+_SECTION = struct.Struct("<Q")
+_PARTITION = struct.Struct("<HQ")
+_SNAPSHOT_FILE = "snapshot.bin"
+_LOCK_FILE = "journal.lock"
+
+_TASKS = TypeAdapter(list[Task])
+_EVENTS = TypeAdapter(list[Event])
+_PLANS = TypeAdapter(list[Plan])
+_ROWS = {Task: _TASKS, Event: _EVENTS, Plan: _PLANS}
+_KEYS = {Task: "task_id", Event: "event_id", Plan: "plan_id"}
+_PLAIN = (str, int, float, bool, list, dict, type(None))
+
+
+# Snapshot sections are a table of (tenant ID, JSON array of that tenant's
+# rows), so a restart only has to walk the table. The file is only ever
+# written by this process from validated models, so a tenant is rebuilt with
+# model_construct, which fills in defaults for fields added since the snapshot
+# was taken; only fields JSON cannot carry (datetimes, nested models) go through
+# a per-field TypeAdapter. The magic carries the format version and any other
+# version is rejected. v1 snapshots are still read, eagerly, through the
+# validating path.
+def _is_plain(annotation) -> bool:
+    origin = get_origin(annotation)
+    if origin is None:
+        return annotation in _PLAIN
+    if origin is Literal:
+        return True
+    return origin in (Union, UnionType, list, dict) and all(_is_plain(arg) for arg in get_args(annotation))
+
+
+def _converter(annotation) -> Callable:
+    args = [arg for arg in get_args(annotation) if arg is not type(None)]
+    target = args[0] if len(args) == 1 else annotation
+    if target in (datetime, date):
+        return target.fromisoformat
+    return TypeAdapter(annotation).validate_python
+
+
+@cache
+def _converters(model: type[BaseModel]) -> dict[str, Callable]:
+    return {
+        name: _converter(field.annotation)
+        for name, field in model.model_fields.items()
+        if not _is_plain(field.annotation)
+    }
+
+
+def _partitions(entities: TenantMap) -> list[tuple[str, list[BaseModel]]]:
+    return [(tenant_id, list(entities.partition(tenant_id).values())) for tenant_id in entities.tenants()]
+
+
+def _encode_partitions(model: type[BaseModel], partitions: list[tuple[str, list[BaseModel]]]) -> bytes:
+    chunks: list[bytes] = []
+    for tenant_id, rows in partitions:
+        tenant = tenant_id.encode()
+        payload = _ROWS[model].dump_json(rows)
+        chunks.append(_PARTITION.pack(len(tenant), len(payload)))
+        chunks.append(tenant)
+        chunks.append(payload)
+    return b"".join(chunks)
+
+
+def _decode_partitions(view: memoryview) -> list[tuple[str, bytes]]:
+    partitions: list[tuple[str, bytes]] = []
+    offset = 0
+    while offset < len(view):
+        tenant_size, size = _PARTITION.unpack_from(view, offset)
+        offset += _PARTITION.size
+        tenant_id = bytes(view[offset : offset + tenant_size]).decode()
+        offset += tenant_size
+        partitions.append((tenant_id, bytes(view[offset : offset + size])))
+        offset += size
+    return partitions
+
+
+# Every object allocated while loading survives; letting the cyclic collector
+# scan them on the way, or again between tenants, doubles the load time.
+@contextmanager
+def _gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _load_all(store: InMemoryStore) -> None:
+    with _gc_paused():
+        store.load_all()
+
+
+def _load_models(model: type[BaseModel], data: bytes) -> dict[str, BaseModel]:
+    construct = model.model_construct
+    converters = _converters(model).items()
+    key = _KEYS[model]
+    instances = {}
+    with _gc_paused():
+        for values in json.loads(data):
+            for name, convert in converters:
+                value = values.get(name)
+                if value is not None:
+                    values[name] = convert(value)
+            instances[values[key]] = construct(**values)
+    return instances
+
+
+def _load_partition(
+    model: type[BaseModel], data: bytes, changes: dict[str, BaseModel], deleted: set[str]
+) -> dict[str, BaseModel]:
+    rows = _load_models(model, data)
+    for key in deleted:
+        rows.pop(key, None)
+    rows.update(changes)
+    return rows
+
+
+def _segment_path(data_dir: Path, generation: int) -> Path:
+    return data_dir / f"wal-{generation:010d}.log"
+
+
+def _segment_generation(path: Path) -> int:
+    return int(path.stem.split("-", 1)[1])
+
+
+# Held for as long as the directory is open, so a second worker pointed at the
+# same directory fails at startup instead of interleaving writes.
+def lock_directory(path: Path, name: str) -> BinaryIO:
+    file = open(path / name, "a+b")
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        raise RuntimeError(f"{path} is in use by another process") from None
+    return file
+
+
+def fsync_directory(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Write-ahead log frames are (payload length, crc32, op) followed by the payload.
+# op is kind_index * 2 for a put carrying the entity JSON and kind_index * 2 + 1
+# for a delete carrying the bare ID. A frame records the entity's state at
+# append time, so replay is idempotent and a snapshot may overlap the log.
+class Journal:
+    def __init__(self, store: InMemoryStore, data_dir: str | None, snapshot_interval: float) -> None:
+        self._store = store
+        self._dir = Path(data_dir) if data_dir else None
+        self._snapshot_interval = snapshot_interval
+        self._cond = threading.Condition()
+        self._pending: list[bytes | int] = []
+        self._appended = 0
+        self._durable = 0
+        self._snapshot_ticket = 0
+        self._generation = 0
+        self._error: OSError | None = None
+        self._closed = False
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self._dir is not None
+
+    def open(self) -> None:
+        if self._dir is None:
+            return
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._lock_file = lock_directory(self._dir, _LOCK_FILE)
+        try:
+            self._generation = self._recover()
+        except BaseException:
+            self._lock_file.close()
+            raise
+        self._file = open(_segment_path(self._dir, self._generation), "ab")
+        self._threads = [
+            threading.Thread(target=self._flush_loop, name="journal-flush", daemon=True),
+            threading.Thread(target=self._snapshot_loop, name="journal-snapshot", daemon=True),
+            threading.Thread(target=_load_all, args=(self._store,), name="journal-warm-up", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self) -> None:
+        if self._dir is None or not self._threads:
+            return
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._file.close()
+        self._lock_file.close()
+
+    def record(self, kind: str, key: str) -> None:
+        if self._dir is None:
+            return
+        with self._cond:
+            self._pending.append(self._encode(kind, key))
+            self._appended += 1
+            ticket = self._appended
+            self._cond.notify_all()
+            while self._durable < ticket and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise ApiError(status_code=500, message_id="E-0500", message="サーバでエラーが発生しました")
+
+    def snapshot(self) -> None:
+        if self._dir is None:
+            return
+        store = self._store
+        _load_all(store)
+        with self._cond:
+            tasks = _partitions(store.tasks)
+            events = _partitions(store.events)
+            plans = _partitions(store.plans)
+            task_table = store.plan_blocks.task_table()
+            plan_blocks = store.plan_blocks.items()
+            self._generation += 1
+            generation = self._generation
+            self._pending.append(generation)
+            self._appended += 1
+            ticket = self._appended
+            self._snapshot_ticket = ticket
+            self._cond.notify_all()
+
+        path = self._dir / _SNAPSHOT_FILE
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "wb") as file:
+            file.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, generation))
+            for section in (
+                _encode_partitions(Task, tasks),
+                _encode_partitions(Event, events),
+                _encode_partitions(Plan, plans),
+                json.dumps(task_table).encode(),
+                _encode_plan_blocks(plan_blocks),
+            ):
+                file.write(_SECTION.pack(len(section)))
+                file.write(section)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        fsync_directory(self._dir)
+
+        with self._cond:
+            while self._durable < ticket and self._error is None:
+                self._cond.wait()
+        for segment in self._dir.glob("wal-*.log"):
+            if _segment_generation(segment) < generation:
+                segment.unlink()
+
+    def _encode(self, kind: str, key: str) -> bytes:
+        store = self._store
+        if kind == "task":
+            entity = store.tasks.get(key)
+            payload = entity.model_dump_json().encode() if entity else None
+        elif kind == "event":
+            entity = store.events.get(key)
+            payload = entity.model_dump_json().encode() if entity else None
+        else:
+            entity = store.plans.get(key)
+            payload = None
+            if entity:
+                record = PlanRecord(plan=entity, blocks=store.plan_blocks.get(key) or [])
+                payload = record.model_dump_json().encode()
+        op = _KINDS.index(kind) * 2
+        if payload is None:
+            op += 1
+            payload = key.encode()
+        return _FRAME.pack(len(payload), zlib.crc32(payload), op) + payload
+
+    def _flush_loop(self) -> None:
+        file = self._file
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = []
+                ticket = self._appended
+            try:
+                for item in batch:
+                    if isinstance(item, int):
+                        file.flush()
+                        os.fsync(file.fileno())
+                        file.close()
+                        file = open(_segment_path(self._dir, item), "ab")
+                        self._file = file
+                        fsync_directory(self._dir)
+                    else:
+                        file.write(item)
+                file.flush()
+                os.fsync(file.fileno())
+            except OSError as error:
+                with self._cond:
+                    self._error = error
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable = ticket
+                self._cond.notify_all()
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop.wait(self._snapshot_interval):
+            if self._appended > self._snapshot_ticket:
+                self.snapshot()
+
+    def _recover(self) -> int:
+        store = self._store
+        generation = 0
+        partitions: dict[str, list[tuple[str, bytes]]] = {}
+        path = self._dir / _SNAPSHOT_FILE
+        if path.exists() and path.stat().st_size > 0:
+            generation, partitions = _load_snapshot(store, path)
+
+        changes: dict[str, dict[str, BaseModel | None]] = {kind: {} for kind in _KINDS}
+        segments = sorted(self._dir.glob("wal-*.log"), key=_segment_generation)
+        for segment in segments:
+            segment_generation = _segment_generation(segment)
+            if segment_generation < generation:
+                segment.unlink()
+                continue
+            _replay_segment(store, segment, changes)
+            generation = segment_generation
+        _restore(store.tasks, Task, partitions.get("task", []), changes["task"])
+        _restore(store.events, Event, partitions.get("event", []), changes["event"])
+        _restore(store.plans, Plan, partitions.get("plan", []), changes["plan"])
+        store.invalidate_events()
+        return generation
+
+
+def _encode_plan_blocks(items: list[tuple[str, CompactPlanBlocks]]) -> bytes:
+    return b"".join(encode_compact(plan_id, packed) for plan_id, packed in items)
+
+
+def _decode_plan_blocks(view: memoryview) -> dict[str, CompactPlanBlocks]:
+    plans: dict[str, CompactPlanBlocks] = {}
+    offset = 0
+    while offset < len(view):
+        plan_id, packed, offset = decode_compact(view, offset)
+        plans[plan_id] = packed
+    return plans
+
+
+def _load_snapshot(store: InMemoryStore, path: Path) -> tuple[int, dict[str, list[tuple[str, bytes]]]]:
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        magic, generation = _SNAPSHOT_HEADER.unpack_from(mapped, 0)
+        if magic not in (_SNAPSHOT_MAGIC, _SNAPSHOT_MAGIC_JSON):
+            raise ValueError(f"unsupported snapshot version {magic!r}: {path}")
+        offset = _SNAPSHOT_HEADER.size
+        sections: list[bytes] = []
+        for _ in range(5):
+            (size,) = _SECTION.unpack_from(mapped, offset)
+            offset += _SECTION.size
+            sections.append(mapped[offset : offset + size])
+            offset += size
+
+    store.tasks.clear()
+    store.events.clear()
+    store.plans.clear()
+    partitions: dict[str, list[tuple[str, bytes]]] = {}
+    task_table = json.loads(sections[3])
+    if magic == _SNAPSHOT_MAGIC:
+        partitions = {kind: _decode_partitions(memoryview(section)) for kind, section in zip(_KINDS, sections)}
+    else:
+        store.tasks.update((task.task_id, task) for task in _TASKS.validate_json(sections[0]))
+        store.events.update((event.event_id, event) for event in _EVENTS.validate_json(sections[1]))
+        store.plans.update((plan.plan_id, plan) for plan in _PLANS.validate_json(sections[2]))
+        # v1 kept bare task IDs; titles are only known for tasks that still exist.
+        task_table = [(task_id, getattr(store.tasks.get(task_id), "title", None)) for task_id in task_table]
+    store.plan_blocks.restore(task_table, _decode_plan_blocks(memoryview(sections[4])))
+    return generation, partitions
+
+
+# Frames replayed over a snapshot are folded into the loader of the deferred
+# tenant they belong to, so replaying the log never forces a load. A delete
+# frame only carries the ID, so every deferred tenant of that kind drops it.
+def _restore(
+    entities: TenantMap,
+    model: type[BaseModel],
+    partitions: list[tuple[str, bytes]],
+    changes: dict[str, BaseModel | None],
+) -> None:
+    deleted = {key for key, value in changes.items() if value is None}
+    updates: dict[str, dict[str, BaseModel]] = {}
+    for key, value in changes.items():
+        if value is not None:
+            updates.setdefault(value.tenant_id, {})[key] = value
+    for tenant_id, data in partitions:
+        entities.defer(tenant_id, partial(_load_partition, model, data, updates.pop(tenant_id, {}), deleted))
+    for key in deleted:
+        entities.pop(key, None)
+    for rows in updates.values():
+        entities.update(rows.items())
+
+
+def _replay_segment(store: InMemoryStore, path: Path, changes: dict[str, dict[str, BaseModel | None]]) -> None:
+    with open(path, "r+b") as file:
+        data = file.read()
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            size, checksum, op = _FRAME.unpack_from(data, offset)
+            start = offset + _FRAME.size
+            payload = data[start : start + size]
+            if len(payload) < size or zlib.crc32(payload) != checksum:
+                break
+            _apply(store, op, payload, changes)
+            offset = start + size
+        if offset < len(data):
+            file.truncate(offset)
+
+
+def _apply(store: InMemoryStore, op: int, payload: bytes, changes: dict[str, dict[str, BaseModel | None]]) -> None:
+    kind = _KINDS[op // 2]
+    if op % 2:
+        key = payload.decode()
+        changes[kind][key] = None
+        if kind == "plan":
+            store.plan_blocks.pop(key)
+        return
+    if kind == "task":
+        task = Task.model_validate_json(payload)
+        changes[kind][task.task_id] = task
+    elif kind == "event":
+        event = Event.model_validate_json(payload)
+        changes[kind][event.event_id] = event
+    else:
+        record = PlanRecord.model_validate_json(payload)
+        changes[kind][record.plan.plan_id] = record.plan
+        store.plan_blocks.put(record.plan.plan_id, plan_base(record.plan), record.blocks)
+
+
+JOURNAL = Journal(
+    STORE,
+    os.environ.get("STORE_DATA_DIR"),
+    float(os.environ.get("STORE_SNAPSHOT_INTERVAL_SECONDS", "300")),
+)
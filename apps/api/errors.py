@@ -17,6 +17,7 @@ class ApiError(Exception):
     message_id: str
     message: str
     field_errors: Iterable[FieldError] | None = None
+    headers: dict[str, str] | None = None
 
 
 def error_response(error: ApiError) -> JSONResponse:
@@ -32,6 +33,7 @@ def error_response(error: ApiError) -> JSONResponse:
         ]
     return JSONResponse(
         status_code=error.status_code,
+        headers=error.headers,
         content={
             "error": {
                 "message_id": error.message_id,
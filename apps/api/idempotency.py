@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from .errors import ApiError, error_response
+
+
+@dataclass
+class IdempotentEntry:
+    fingerprint: bytes
+    expires_at: float
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    status: int | None = None
+    headers: list[tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+
+class IdempotencyCache:
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, str, str], IdempotentEntry] = OrderedDict()
+
+    def get(self, key: tuple[str, str, str]) -> IdempotentEntry | None:
+        entry = self._entries.get(key)
+        if entry is not None and entry.status is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    # Entries still in flight are never evicted, since a retry waiting on one
+    # would otherwise run the handler again; the cache may briefly hold more
+    # than max_entries while they finish.
+    def begin(self, key: tuple[str, str, str], fingerprint: bytes) -> IdempotentEntry:
+        now = time.monotonic()
+        excess = len(self._entries) + 1 - self._max_entries
+        expired: list[tuple[str, str, str]] = []
+        for old_key, old_entry in self._entries.items():
+            if old_entry.status is None:
+                continue
+            if old_entry.expires_at > now and excess <= 0:
+                break
+            expired.append(old_key)
+            excess -= 1
+        for old_key in expired:
+            del self._entries[old_key]
+        entry = IdempotentEntry(fingerprint=fingerprint, expires_at=now + self._ttl_seconds)
+        self._entries[key] = entry
+        return entry
+
+    def discard(self, key: tuple[str, str, str], entry: IdempotentEntry) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+async def _buffer_body(receive):
+    messages = []
+    chunks = []
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return b"".join(chunks), replay
+
+
+# Responses to POST requests carrying an Idempotency-Key header are stored per
+# (tenant, path, key) and replayed for retries. A retry that arrives while the
+# first request is still running waits for it instead of running the handler
+# again. 429 and 5xx responses are not stored so that a retry can succeed.
+class IdempotencyMiddleware:
+    def __init__(self, app, cache: IdempotencyCache) -> None:
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                idempotency_key = value.decode("latin-1")
+                break
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        body, receive = await _buffer_body(receive)
+        fingerprint = hashlib.sha256(body).digest()
+        key = (scope.get("state", {}).get("tenant_id", ""), scope["path"], idempotency_key)
+        while True:
+            entry = self.cache.get(key)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                response = error_response(
+                    ApiError(
+                        status_code=422,
+                        message_id="E-0422",
+                        message="同じIdempotency-Keyで異なるリクエストが送信されました",
+                    )
+                )
+                await response(scope, receive, send)
+                return
+            if entry.status is not None:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": entry.status,
+                        "headers": entry.headers + [(b"idempotent-replayed", b"true")],
+                    }
+                )
+                await send({"type": "http.response.body", "body": entry.body})
+                return
+            await entry.done.wait()
+
+        entry = self.cache.begin(key, fingerprint)
+        status = None
+        headers: list[tuple[bytes, bytes]] = []
+        chunks: list[bytes] = []
+
+        async def capture(message) -> None:
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            if status is not None and status < 500 and status != 429:
+                entry.headers = headers
+                entry.body = b"".join(chunks)
+                entry.status = status
+            else:
+                self.cache.discard(key, entry)
+            entry.done.set()
+
+
+IDEMPOTENCY = IdempotencyCache(
+    int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+    float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Mapping
+
+from .scheduler import _event_interval, _subtract_intervals
+from .schemas import Event
+
+
+# Overlapping events are merged into disjoint intervals sorted by start, so the
+# end times are sorted too and a range query is one bisect plus k matches.
+# The index is rebuilt lazily on the first query after invalidate().
+class BusyIntervalIndex:
+    def __init__(self, events: Mapping[str, Event], tz: tzinfo) -> None:
+        self._events = events
+        self._tz = tz
+        self._version = 0
+        self._built_version = -1
+        self._intervals: tuple[list[datetime], list[datetime]] = ([], [])
+
+    def invalidate(self) -> None:
+        self._version += 1
+
+    def _rebuild(self) -> None:
+        version = self._version
+        intervals = sorted(
+            _event_interval(event, self._tz) for event in list(self._events.values())
+        )
+        starts: list[datetime] = []
+        ends: list[datetime] = []
+        for start, end in intervals:
+            if start >= end:
+                continue
+            if ends and start <= ends[-1]:
+                if end > ends[-1]:
+                    ends[-1] = end
+                continue
+            starts.append(start)
+            ends.append(end)
+        self._intervals = (starts, ends)
+        self._built_version = version
+
+    def query(self, range_start: datetime, range_end: datetime) -> list[tuple[datetime, datetime]]:
+        if self._built_version != self._version:
+            self._rebuild()
+        starts, ends = self._intervals
+        result: list[tuple[datetime, datetime]] = []
+        index = bisect_right(ends, range_start)
+        while index < len(starts) and starts[index] < range_end:
+            result.append((max(starts[index], range_start), min(ends[index], range_end)))
+            index += 1
+        return result
+
+
+def build_free_busy(
+    index: BusyIntervalIndex,
+    date_from: date,
+    date_to: date,
+    tz: tzinfo,
+    working_hours: list[tuple[time, time]] | None,
+) -> tuple[list[tuple[datetime, datetime]], list[tuple[datetime, datetime]]]:
+    range_start = datetime.combine(date_from, time.min, tzinfo=tz)
+    range_end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=tz)
+    busy = index.query(range_start, range_end)
+
+    free: list[tuple[datetime, datetime]] = []
+    day = date_from
+    while day <= date_to:
+        day_start = datetime.combine(day, time.min, tzinfo=tz)
+        day_end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+        if working_hours is None:
+            slots = [(day_start, day_end)]
+        else:
+            slots = [
+                (
+                    datetime.combine(day, slot_start, tzinfo=tz),
+                    datetime.combine(day, slot_end, tzinfo=tz),
+                )
+                for slot_start, slot_end in working_hours
+            ]
+        for slot_start, slot_end in _subtract_intervals(slots, index.query(day_start, day_end)):
+            if free and free[-1][1] == slot_start:
+                free[-1] = (free[-1][0], slot_end)
+            else:
+                free.append((slot_start, slot_end))
+        day += timedelta(days=1)
+    return busy, free
@@ -1,20 +1,32 @@
 from __future__ import annotations
 
-from datetime import date, datetime
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time
+from time import monotonic
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 
-from fastapi import FastAPI, Query
+from fastapi import Depends, FastAPI, Query, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
+from .admission import PLAN_ADMISSION
+from .blockstore import plan_base
+from .changes import CHANGES, encode_record
+from .durability import JOURNAL
 from .errors import ApiError, FieldError, error_response
-from .scheduler import build_free_slots, schedule
+from .idempotency import IDEMPOTENCY, IdempotencyMiddleware
+from .intervals import build_free_busy
+from .scheduler import ScheduleResult, build_free_slots, schedule
 from .schemas import (
+    DEFAULT_TENANT,
+    Constraints,
     Event,
     EventCreateRequest,
     EventUpdateRequest,
+    FreeBusy,
+    OverflowItem,
     Plan,
     PlanBlock,
     PlanGenerateRequest,
@@ -23,14 +35,53 @@ from .schemas import (
     Task,
     TaskCreateRequest,
     TaskUpdateRequest,
+    TeamPlanGenerateRequest,
+    TimeInterval,
     WarningItem,
     WorkingHour,
 )
+from .optimize import optimize_schedule
+from .responses import (
+    BLOCK_BODIES,
+    DAY_BODIES,
+    PLAN_BODIES,
+    body_response,
+    encode_body,
+    json_response,
+)
 from .storage import STORE
-from .validation import normalize_plan_request, validate_event_request, validate_task_request
+from .team import MemberSlots, assign_team_tasks
+from .tenancy import TENANT_RING, TENANT_STATS, TENANT_WORKER_URL, TenantMiddleware, check_worker
+from .tiering import COLD_PLANS
+from .tracing import TRACES, ScheduleTrace, sample_trace
+from .validation import (
+    normalize_freebusy_request,
+    normalize_plan_request,
+    normalize_team_plan_request,
+    validate_event_request,
+    validate_task_request,
+)
+
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    check_worker(TENANT_RING, TENANT_WORKER_URL)
+    JOURNAL.open()
+    COLD_PLANS.open()
+    COLD_PLANS.spill(_now().date())
+    yield
+    COLD_PLANS.close()
+    JOURNAL.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(IdempotencyMiddleware, cache=IDEMPOTENCY)
+app.add_middleware(
+    TenantMiddleware,
+    ring=TENANT_RING,
+    worker_url=TENANT_WORKER_URL,
+    stats=TENANT_STATS,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -44,6 +95,82 @@ def _now() -> datetime:
     return datetime.now(tz=ZoneInfo("Asia/Tokyo"))
 
 
+def _day_key(tenant_id: str, day: date) -> str:
+    return f"{tenant_id}/{day.isoformat()}"
+
+
+def _tenant_prefix(tenant_id: str) -> str:
+    return f"{tenant_id}/"
+
+
+def _blocks_key(tenant_id: str, plan_id: str) -> str:
+    return f"{tenant_id}/{plan_id}"
+
+
+def _event_day_key(event: Event) -> str:
+    return _day_key(event.tenant_id, event.start_at.astimezone(ZoneInfo("Asia/Tokyo")).date())
+
+
+# Tenants restored from a snapshot are materialized on first use, so every
+# tenant-scoped route loads its tenant before touching STORE.
+def _tenant_id(request: Request) -> str:
+    tenant_id = getattr(request.state, "tenant_id", DEFAULT_TENANT)
+    STORE.load_tenant(tenant_id)
+    return tenant_id
+
+
+def _plan_summary(plan_id: str) -> Plan | PlanListItem | None:
+    return STORE.plans.get(plan_id) or COLD_PLANS.summary(plan_id)
+
+
+def _owned(entity, tenant_id: str):
+    if entity is None or entity.tenant_id != tenant_id:
+        return None
+    return entity
+
+
+# The journal encodes the entity as it stands in STORE, so mutations are applied
+# first and recorded here. If the write fails, the previous state is put back
+# and every derived cache dropped, so a 500 never leaves an unjournaled change
+# visible to the next request.
+def _record_change(
+    entity: str,
+    entity_id: str,
+    op: str,
+    tenant_id: str,
+    previous: Task | Event | Plan | None = None,
+    previous_blocks: list[PlanBlock] | None = None,
+) -> None:
+    try:
+        JOURNAL.record(entity, entity_id)
+    except ApiError:
+        _restore(entity, entity_id, tenant_id, previous, previous_blocks)
+        raise
+    CHANGES.publish(entity, entity_id, op, tenant_id)
+
+
+def _restore(
+    entity: str,
+    entity_id: str,
+    tenant_id: str,
+    previous: Task | Event | Plan | None,
+    previous_blocks: list[PlanBlock] | None,
+) -> None:
+    collection = {"task": STORE.tasks, "event": STORE.events, "plan": STORE.plans}[entity]
+    if previous is None:
+        collection.pop(entity_id, None)
+        if entity == "plan":
+            STORE.plan_blocks.pop(entity_id)
+    else:
+        collection[entity_id] = previous
+        if entity == "plan":
+            STORE.plan_blocks.put(entity_id, plan_base(previous), previous_blocks or [])
+    STORE.invalidate_events()
+    PLAN_BODIES.invalidate(entity_id)
+    BLOCK_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    DAY_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+
+
 @app.exception_handler(ApiError)
 def handle_api_error(_, exc: ApiError) -> JSONResponse:
     return error_response(exc)
@@ -69,8 +196,12 @@ def handle_validation_error(_, exc: RequestValidationError) -> JSONResponse:
 
 
 @app.get("/tasks")
-def list_tasks(status: str | None = None, q: str | None = None) -> dict:
-    tasks = list(STORE.tasks.values())
+def list_tasks(
+    status: str | None = None,
+    q: str | None = None,
+    tenant_id: str = Depends(_tenant_id),
+) -> dict:
+    tasks = list(STORE.tasks.partition(tenant_id).values())
     if status:
         tasks = [task for task in tasks if task.status == status]
     if q:
@@ -79,32 +210,39 @@ def list_tasks(status: str | None = None, q: str | None = None) -> dict:
 
 
 @app.post("/tasks", status_code=201)
-def create_task(request: TaskCreateRequest) -> dict:
+def create_task(request: TaskCreateRequest, tenant_id: str = Depends(_tenant_id)) -> dict:
     validate_task_request(TaskUpdateRequest(**request.model_dump()))
     task_id = str(uuid4())
     now = _now()
     task = Task(
         task_id=task_id,
+        tenant_id=tenant_id,
         status="open",
         created_at=now,
         updated_at=now,
         **request.model_dump(),
     )
     STORE.tasks[task_id] = task
+    DAY_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    _record_change("task", task_id, "create", tenant_id)
     return {"data": {"task_id": task_id}, "meta": {"message_id": "I-0001"}}
 
 
 @app.get("/tasks/{task_id}")
-def get_task(task_id: str) -> dict:
-    task = STORE.tasks.get(task_id)
+def get_task(task_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    task = _owned(STORE.tasks.get(task_id), tenant_id)
     if not task:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
     return {"data": task, "meta": {}}
 
 
 @app.patch("/tasks/{task_id}")
-def update_task(task_id: str, request: TaskUpdateRequest) -> dict:
-    task = STORE.tasks.get(task_id)
+def update_task(
+    task_id: str,
+    request: TaskUpdateRequest,
+    tenant_id: str = Depends(_tenant_id),
+) -> dict:
+    task = _owned(STORE.tasks.get(task_id), tenant_id)
     if not task:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
 
@@ -140,24 +278,34 @@ def update_task(task_id: str, request: TaskUpdateRequest) -> dict:
     updated_task = task.model_copy(update=updates)
     updated_task.updated_at = _now()
     STORE.tasks[task_id] = updated_task
+    if "title" in updates:
+        BLOCK_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    DAY_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    _record_change("task", task_id, "update", tenant_id, previous=task)
     return {"data": {"task_id": task_id}, "meta": {"message_id": "I-0002"}}
 
 
 @app.delete("/tasks/{task_id}")
-def delete_task(task_id: str) -> dict:
-    task = STORE.tasks.pop(task_id, None)
+def delete_task(task_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    task = _owned(STORE.tasks.get(task_id), tenant_id)
     if not task:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
+    STORE.tasks.pop(task_id, None)
+    BLOCK_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    DAY_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    _record_change("task", task_id, "delete", tenant_id, previous=task)
     return {"data": {"task_id": task_id}, "meta": {"message_id": "I-0003"}}
 
 
 @app.post("/tasks/{task_id}/complete")
-def complete_task(task_id: str) -> dict:
-    task = STORE.tasks.get(task_id)
+def complete_task(task_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    task = _owned(STORE.tasks.get(task_id), tenant_id)
     if not task:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
     updated_task = task.model_copy(update={"status": "done", "updated_at": _now()})
     STORE.tasks[task_id] = updated_task
+    DAY_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    _record_change("task", task_id, "update", tenant_id, previous=task)
     return {
         "data": {"task_id": task_id, "status": "done"},
         "meta": {"message_id": "I-0004"},
@@ -165,12 +313,14 @@ def complete_task(task_id: str) -> dict:
 
 
 @app.post("/tasks/{task_id}/reopen")
-def reopen_task(task_id: str) -> dict:
-    task = STORE.tasks.get(task_id)
+def reopen_task(task_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    task = _owned(STORE.tasks.get(task_id), tenant_id)
     if not task:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
     updated_task = task.model_copy(update={"status": "open", "updated_at": _now()})
     STORE.tasks[task_id] = updated_task
+    DAY_BODIES.invalidate_prefix(_tenant_prefix(tenant_id))
+    _record_change("task", task_id, "update", tenant_id, previous=task)
     return {
         "data": {"task_id": task_id, "status": "open"},
         "meta": {"message_id": "I-0005"},
@@ -178,42 +328,45 @@ def reopen_task(task_id: str) -> dict:
 
 
 @app.get("/events")
-def list_events(date: date = Query(...)) -> dict:
-    events = []
-    tzinfo = ZoneInfo("Asia/Tokyo")
-    for event in STORE.events.values():
-        if event.start_at.astimezone(tzinfo).date() == date:
-            events.append(event)
-    return {"data": events, "meta": {}}
+def list_events(date: date = Query(...), tenant_id: str = Depends(_tenant_id)) -> dict:
+    return {"data": STORE.events.lookup(tenant_id, date), "meta": {}}
 
 
 @app.post("/events", status_code=201)
-def create_event(request: EventCreateRequest) -> dict:
+def create_event(request: EventCreateRequest, tenant_id: str = Depends(_tenant_id)) -> dict:
     validate_event_request(EventUpdateRequest(**request.model_dump()))
     event_id = str(uuid4())
     now = _now()
     event = Event(
         event_id=event_id,
+        tenant_id=tenant_id,
         locked=True,
         created_at=now,
         updated_at=now,
         **request.model_dump(),
     )
     STORE.events[event_id] = event
+    STORE.invalidate_events(tenant_id)
+    DAY_BODIES.invalidate(_event_day_key(event))
+    _record_change("event", event_id, "create", tenant_id)
     return {"data": {"event_id": event_id}, "meta": {"message_id": "I-0101"}}
 
 
 @app.get("/events/{event_id}")
-def get_event(event_id: str) -> dict:
-    event = STORE.events.get(event_id)
+def get_event(event_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    event = _owned(STORE.events.get(event_id), tenant_id)
     if not event:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
     return {"data": event, "meta": {}}
 
 
 @app.patch("/events/{event_id}")
-def update_event(event_id: str, request: EventUpdateRequest) -> dict:
-    event = STORE.events.get(event_id)
+def update_event(
+    event_id: str,
+    request: EventUpdateRequest,
+    tenant_id: str = Depends(_tenant_id),
+) -> dict:
+    event = _owned(STORE.events.get(event_id), tenant_id)
     if not event:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
     validate_event_request(request)
@@ -233,21 +386,52 @@ def update_event(event_id: str, request: EventUpdateRequest) -> dict:
     updated_event = event.model_copy(update=updates)
     updated_event.updated_at = _now()
     STORE.events[event_id] = updated_event
+    STORE.invalidate_events(tenant_id)
+    DAY_BODIES.invalidate(_event_day_key(event))
+    DAY_BODIES.invalidate(_event_day_key(updated_event))
+    _record_change("event", event_id, "update", tenant_id, previous=event)
     return {"data": {"event_id": event_id}, "meta": {"message_id": "I-0102"}}
 
 
 @app.delete("/events/{event_id}")
-def delete_event(event_id: str) -> dict:
-    event = STORE.events.pop(event_id, None)
+def delete_event(event_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    event = _owned(STORE.events.get(event_id), tenant_id)
     if not event:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
+    STORE.events.pop(event_id, None)
+    STORE.invalidate_events(tenant_id)
+    DAY_BODIES.invalidate(_event_day_key(event))
+    _record_change("event", event_id, "delete", tenant_id, previous=event)
     return {"data": {"event_id": event_id}, "meta": {"message_id": "I-0103"}}
 
 
+@app.get("/freebusy")
+def get_freebusy(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    working_hours: str | None = None,
+    tenant_id: str = Depends(_tenant_id),
+) -> dict:
+    working_slots = normalize_freebusy_request(date_from, date_to, working_hours)
+    busy, free = build_free_busy(
+        STORE.event_index(tenant_id),
+        date_from,
+        date_to,
+        ZoneInfo("Asia/Tokyo"),
+        working_slots,
+    )
+    freebusy = FreeBusy(
+        busy=[TimeInterval(start_at=start, end_at=end) for start, end in busy],
+        free=[TimeInterval(start_at=start, end_at=end) for start, end in free],
+    )
+    return {"data": freebusy, "meta": {}}
+
+
 @app.get("/plans")
 def list_plans(
     date_from: date | None = None,
     date_to: date | None = None,
+    tenant_id: str = Depends(_tenant_id),
 ) -> dict:
     if date_from and date_to and date_from > date_to:
         raise ApiError(
@@ -257,7 +441,15 @@ def list_plans(
             field_errors=[FieldError("date_from", "E-0400", "日付範囲を確認してください")],
         )
     plans = []
-    for plan in STORE.plans.values():
+    for summary in COLD_PLANS.summaries(tenant_id):
+        if summary.plan_id in STORE.plans:
+            continue
+        if date_from and summary.date < date_from:
+            continue
+        if date_to and summary.date > date_to:
+            continue
+        plans.append(summary)
+    for plan in STORE.plans.partition(tenant_id).values():
         if date_from and plan.date < date_from:
             continue
         if date_to and plan.date > date_to:
@@ -265,8 +457,10 @@ def list_plans(
         plans.append(
             PlanListItem(
                 plan_id=plan.plan_id,
+                tenant_id=plan.tenant_id,
                 date=plan.date,
                 timezone=plan.timezone,
+                member=plan.member,
                 created_at=plan.created_at,
                 updated_at=plan.updated_at,
             )
@@ -275,51 +469,307 @@ def list_plans(
 
 
 @app.get("/plans/{plan_id}")
-def get_plan(plan_id: str) -> dict:
-    plan = STORE.plans.get(plan_id)
-    if not plan:
+def get_plan(plan_id: str, tenant_id: str = Depends(_tenant_id)) -> Response:
+    if not _owned(_plan_summary(plan_id), tenant_id):
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
-    return {"data": plan, "meta": {}}
+    body = PLAN_BODIES.get(plan_id)
+    if body is None:
+        generation = PLAN_BODIES.generation
+        plan = STORE.plans.get(plan_id) or COLD_PLANS.get_plan(plan_id)
+        if not plan:
+            raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
+        body = encode_body({"data": plan, "meta": {}})
+        PLAN_BODIES.put(plan_id, body, generation)
+    return body_response(body)
 
 
 @app.get("/plans/{plan_id}/blocks")
-def get_plan_blocks(plan_id: str) -> dict:
-    if plan_id not in STORE.plans:
+def get_plan_blocks(plan_id: str, tenant_id: str = Depends(_tenant_id)) -> Response:
+    if not _owned(_plan_summary(plan_id), tenant_id):
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
-    blocks = STORE.plan_blocks.get(plan_id, [])
-    return {"data": blocks, "meta": {}}
+    body = BLOCK_BODIES.get(_blocks_key(tenant_id, plan_id))
+    if body is None:
+        generation = BLOCK_BODIES.generation
+        blocks = STORE.plan_blocks.get(plan_id)
+        if blocks is None:
+            blocks = COLD_PLANS.get_blocks(plan_id)
+        if blocks is None:
+            if plan_id not in STORE.plans:
+                raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
+            blocks = []
+        body = encode_body({"data": blocks, "meta": {}})
+        BLOCK_BODIES.put(_blocks_key(tenant_id, plan_id), body, generation)
+    return body_response(body)
 
 
 @app.delete("/plans/{plan_id}")
-def delete_plan(plan_id: str) -> dict:
-    plan = STORE.plans.pop(plan_id, None)
-    if not plan:
+def delete_plan(plan_id: str, tenant_id: str = Depends(_tenant_id)) -> dict:
+    summary = _owned(_plan_summary(plan_id), tenant_id)
+    if not summary:
         raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
-    STORE.plan_blocks.pop(plan_id, None)
+    blocks = STORE.plan_blocks.get(plan_id)
+    plan = STORE.plans.pop(plan_id, None)
+    STORE.plan_blocks.pop(plan_id)
+    PLAN_BODIES.invalidate(plan_id)
+    BLOCK_BODIES.invalidate(_blocks_key(tenant_id, plan_id))
+    DAY_BODIES.invalidate(_day_key(tenant_id, summary.date))
+    _record_change("plan", plan_id, "delete", tenant_id, previous=plan, previous_blocks=blocks)
+    COLD_PLANS.delete(plan_id)
+    TRACES.pop(plan_id)
     return {"data": {"plan_id": plan_id}, "meta": {"message_id": "I-0202"}}
 
 
+@app.get("/plans/{plan_id}/trace")
+def get_plan_trace(plan_id: str, tenant_id: str = Depends(_tenant_id)) -> Response:
+    trace = TRACES.get(plan_id)
+    if trace is None or not _owned(_plan_summary(plan_id), tenant_id):
+        raise ApiError(status_code=404, message_id="E-0404", message="対象データが存在しません")
+    return json_response({"data": trace, "meta": {}})
+
+
+@app.get("/days/{day}")
+def get_day(day: date, tenant_id: str = Depends(_tenant_id)) -> Response:
+    key = _day_key(tenant_id, day)
+    body = DAY_BODIES.get(key)
+    if body is None:
+        generation = DAY_BODIES.generation
+        # Taken before the reads, so a client resuming /changes from here may
+        # see a change twice but never misses one. A cached body stays valid
+        # since the tenant's writes drop it before they are published.
+        last_event_id = CHANGES.event_id(CHANGES.sequence)
+        tasks = STORE.tasks.lookup(tenant_id, "open")
+        events = STORE.events.lookup(tenant_id, day)
+        latest = None
+        for plan in STORE.plans.lookup(tenant_id, day) + COLD_PLANS.on_day(tenant_id, day):
+            if plan.member is not None:
+                continue
+            if latest is None or plan.created_at >= latest.created_at:
+                latest = plan
+        plan = blocks = None
+        if latest is not None:
+            plan = STORE.plans.get(latest.plan_id) or COLD_PLANS.get_plan(latest.plan_id)
+            blocks = STORE.plan_blocks.get(latest.plan_id)
+            if blocks is None:
+                blocks = COLD_PLANS.get_blocks(latest.plan_id) or []
+        body = encode_body(
+            {
+                "data": {"date": day, "tasks": tasks, "events": events, "plan": plan, "blocks": blocks},
+                "meta": {"last_event_id": last_event_id},
+            }
+        )
+        DAY_BODIES.put(key, body, generation)
+    return body_response(body)
+
+
+@app.get("/stats/tenants")
+def get_tenant_stats() -> dict:
+    return {"data": TENANT_STATS.snapshot(), "meta": {}}
+
+
+@app.get("/stats/admission")
+def get_admission_stats() -> dict:
+    return {"data": {"plans_generate": PLAN_ADMISSION.stats()}, "meta": {}}
+
+
+@app.get("/changes")
+async def get_changes(
+    request: Request,
+    after: str | None = None,
+    timeout: float = Query(25, ge=0, le=60),
+    tenant_id: str = Depends(_tenant_id),
+) -> Response:
+    cursor = CHANGES.parse_cursor(request.headers.get("last-event-id") or after)
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            _change_stream(request, cursor, tenant_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    deadline = monotonic() + timeout
+    while True:
+        records = CHANGES.since(cursor) if cursor is not None else None
+        if records is None:
+            return json_response(
+                {"data": [], "meta": {"last_event_id": CHANGES.event_id(CHANGES.sequence), "reset": True}}
+            )
+        if records:
+            cursor = records[-1]["seq"]
+        records = [record for record in records if record["tenant_id"] == tenant_id]
+        remaining = deadline - monotonic()
+        if records or remaining <= 0 or not await CHANGES.wait(cursor, remaining):
+            break
+    return json_response(
+        {"data": records, "meta": {"last_event_id": CHANGES.event_id(cursor), "reset": False}}
+    )
+
+
+async def _change_stream(request: Request, cursor: int | None, tenant_id: str):
+    yield "retry: 3000\n\n"
+    while not await request.is_disconnected():
+        records = CHANGES.since(cursor) if cursor is not None else None
+        if records is None:
+            cursor = CHANGES.sequence
+            yield f"id: {CHANGES.event_id(cursor)}\nevent: reset\ndata: {{}}\n\n"
+            continue
+        if records:
+            cursor = records[-1]["seq"]
+            events = "".join(
+                f"id: {CHANGES.event_id(record['seq'])}\nevent: change\ndata: {encode_record(record)}\n\n"
+                for record in records
+                if record["tenant_id"] == tenant_id
+            )
+            if events:
+                yield events
+            continue
+        if not await CHANGES.wait(cursor, 15):
+            yield ": keepalive\n\n"
+
+
 @app.post("/plans/generate")
-def generate_plan(request: PlanGenerateRequest) -> dict:
+async def generate_plan(
+    request: PlanGenerateRequest,
+    http_request: Request,
+    tenant_id: str = Depends(_tenant_id),
+) -> Response:
+    client = http_request.client.host if http_request.client else "unknown"
+    return await PLAN_ADMISSION.run(client, _generate_plan, request, tenant_id)
+
+
+def _generate_plan(request: PlanGenerateRequest, tenant_id: str) -> Response:
     working_slots, constraints = normalize_plan_request(request)
     plan_id = str(uuid4())
 
-    tzinfo = ZoneInfo(request.timezone)
-    target_events = [
-        event
-        for event in STORE.events.values()
-        if event.start_at.astimezone(tzinfo).date() == request.date
-    ]
     free_slots = build_free_slots(
         request.date,
         request.timezone,
         working_slots,
-        target_events,
+        _events_on(request.date, request.timezone, tenant_id),
     )
 
-    tasks = [task for task in STORE.tasks.values() if task.status == "open"]
-    schedule_result = schedule(tasks, free_slots, constraints, plan_id)
+    tasks = [task for task in STORE.tasks.partition(tenant_id).values() if task.status == "open"]
+    trace = sample_trace(request.trace)
+    if request.mode == "optimize":
+        schedule_result = optimize_schedule(
+            tasks, free_slots, constraints, plan_id, request.budget_ms, trace=trace
+        )
+    else:
+        schedule_result = schedule(tasks, free_slots, constraints, plan_id, trace=trace)
+    result = _store_plan(
+        plan_id,
+        tenant_id,
+        request.date,
+        request.timezone,
+        working_slots,
+        constraints,
+        schedule_result,
+        trace=trace,
+    )
+
+    return json_response({"data": result, "meta": {"message_id": "I-0201"}})
+
+
+@app.post("/plans/generate-team")
+async def generate_team_plans(
+    request: TeamPlanGenerateRequest,
+    http_request: Request,
+    tenant_id: str = Depends(_tenant_id),
+) -> Response:
+    client = http_request.client.host if http_request.client else "unknown"
+    return await PLAN_ADMISSION.run(client, _generate_team_plans, request, tenant_id)
+
+
+def _generate_team_plans(request: TeamPlanGenerateRequest, tenant_id: str) -> Response:
+    members, constraints = normalize_team_plan_request(request)
+
+    shared_events: list[Event] = []
+    owned_events: dict[str, list[Event]] = {}
+    for event in _events_on(request.date, request.timezone, tenant_id):
+        if event.owner is None:
+            shared_events.append(event)
+        else:
+            owned_events.setdefault(event.owner, []).append(event)
+
+    member_slots = [
+        MemberSlots.build(
+            member_id,
+            build_free_slots(
+                request.date,
+                request.timezone,
+                working_slots,
+                shared_events + owned_events.get(member_id, []),
+            ),
+            constraints,
+        )
+        for member_id, working_slots in members
+    ]
+    tasks = [task for task in STORE.tasks.partition(tenant_id).values() if task.status == "open"]
+    assignments, unassigned = assign_team_tasks(tasks, member_slots, constraints)
+
+    results = []
+    for (member_id, working_slots), slots in zip(members, member_slots):
+        plan_id = str(uuid4())
+        trace = sample_trace(request.trace)
+        schedule_result = schedule(
+            assignments[member_id], slots.free_slots, constraints, plan_id, trace=trace
+        )
+        result = _store_plan(
+            plan_id,
+            tenant_id,
+            request.date,
+            request.timezone,
+            working_slots,
+            constraints,
+            schedule_result,
+            member=member_id,
+            trace=trace,
+        )
+        results.append({"member": member_id, **result})
+
+    overflow = [
+        OverflowItem(
+            task_id=task.task_id,
+            task_title=task.title,
+            estimate_minutes=task.estimate_minutes,
+            priority=task.priority,
+            due_at=task.due_at,
+            reason="no_eligible_member",
+        )
+        for task in unassigned
+    ]
+    warnings = []
+    if overflow:
+        warnings.append(
+            WarningItem(message_id="W-0204", message="担当できるメンバーがいないタスクがあります")
+        )
+    return json_response(
+        {
+            "data": {"plans": results, "overflow": overflow, "warnings": warnings},
+            "meta": {"message_id": "I-0201"},
+        }
+    )
+
+
+def _events_on(target_date: date, timezone: str, tenant_id: str) -> list[Event]:
+    tzinfo = ZoneInfo(timezone)
+    return [
+        event
+        for event in STORE.events.partition(tenant_id).values()
+        if event.start_at.astimezone(tzinfo).date() == target_date
+    ]
+
 
+def _store_plan(
+    plan_id: str,
+    tenant_id: str,
+    target_date: date,
+    timezone: str,
+    working_slots: list[tuple[time, time]],
+    constraints: Constraints,
+    schedule_result: ScheduleResult,
+    member: str | None = None,
+    trace: ScheduleTrace | None = None,
+) -> dict:
     summary = None
     warnings = schedule_result.warnings[:]
     warnings.append(
@@ -337,37 +787,38 @@ def generate_plan(request: PlanGenerateRequest) -> dict:
     now = _now()
     plan = Plan(
         plan_id=plan_id,
-        date=request.date,
-        timezone=request.timezone,
+        tenant_id=tenant_id,
+        date=target_date,
+        timezone=timezone,
         params=params,
         summary=summary,
+        member=member,
         created_at=now,
         updated_at=now,
     )
     STORE.plans[plan_id] = plan
 
-    stored_blocks: list[PlanBlock] = []
-    for block in schedule_result.blocks:
-        stored_blocks.append(
-            PlanBlock(
-                block_id=str(uuid4()),
-                plan_id=plan_id,
-                start_at=block.start_at,
-                end_at=block.end_at,
-                kind=block.kind,
-                task_id=block.task_id,
-                task_title=block.task_title,
-                meta=block.meta or {},
-            )
+    stored_blocks = schedule_result.blocks
+    for block in stored_blocks:
+        block.block_id = str(uuid4())
+        block.plan_id = plan_id
+        block.meta = block.meta or {}
+    STORE.plan_blocks.put(plan_id, plan_base(plan), stored_blocks)
+    DAY_BODIES.invalidate(_day_key(tenant_id, target_date))
+    _record_change("plan", plan_id, "create", tenant_id)
+    if trace is not None and schedule_result.trace is not None:
+        TRACES.put(
+            plan_id,
+            {
+                "plan_id": plan_id,
+                "dropped": trace.dropped,
+                "tasks": schedule_result.trace,
+            },
         )
-    STORE.plan_blocks[plan_id] = stored_blocks
 
     return {
-        "data": {
-            "plan": plan,
-            "blocks": stored_blocks,
-            "overflow": schedule_result.overflow,
-            "warnings": warnings,
-        },
-        "meta": {"message_id": "I-0201"},
+        "plan": plan,
+        "blocks": stored_blocks,
+        "overflow": schedule_result.overflow,
+        "warnings": warnings,
     }
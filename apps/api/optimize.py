@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from .scheduler import ScheduleResult, schedule, task_order
+from .schemas import Constraints, Task
+from .tracing import ScheduleTrace
+
+
+# Cost of one schedule() call per (task, free slot) pair, used to turn the
+# caller's budget into a fixed number of evaluations. schedule() may scan every
+# slot for every task, and the constant is several times what that costs on a
+# development machine, so concurrent requests sharing the interpreter still
+# finish within budget. The search is bounded by that count rather than by the
+# clock, so identical inputs always give the same plan; the wall-clock deadline
+# is only a safety stop.
+EVALUATION_COST_US = 5
+
+
+def _overflow_score(result: ScheduleResult) -> tuple[int, ...]:
+    minutes_by_priority = [0] * 5
+    for item in result.overflow:
+        minutes_by_priority[5 - min(max(item.priority, 1), 5)] += item.estimate_minutes
+    return tuple(minutes_by_priority)
+
+
+def _neighbours(order: list[Task], overflow_ids: set[str]) -> Iterator[list[Task]]:
+    for position, task in enumerate(order):
+        if task.task_id not in overflow_ids:
+            continue
+        rest = order[:position] + order[position + 1 :]
+        for index in range(position):
+            yield rest[:index] + [task] + rest[index:]
+        for index in range(position):
+            blocker = order[index]
+            if blocker.task_id in overflow_ids:
+                continue
+            deferred = order[:index] + order[index + 1 : position + 1]
+            yield deferred + [blocker] + order[position + 1 :]
+
+
+# Hill climbing over the order in which schedule() takes tasks, starting from
+# the priority-first greedy order. Moves either pull an overflowed task earlier
+# or defer a placed task until after it. A move is kept only if it lowers
+# overflow minutes compared priority level by priority level, so a
+# lower-priority task is never fitted in at the cost of a higher-priority one.
+def optimize_schedule(
+    tasks: Iterable[Task],
+    free_slots: list[tuple[datetime, datetime]],
+    constraints: Constraints,
+    plan_id: str,
+    budget_ms: int,
+    trace: ScheduleTrace | None = None,
+) -> ScheduleResult:
+    order = sorted(tasks, key=task_order)
+    best = schedule(order, free_slots, constraints, plan_id, presorted=True, trace=trace)
+    best_score = _overflow_score(best)
+    if not best.overflow:
+        return best
+
+    max_evaluations = budget_ms * 1000 // (EVALUATION_COST_US * (len(order) + 1) * (len(free_slots) + 1))
+    deadline = time.perf_counter() + budget_ms / 1000
+    evaluations = 0
+    improved = True
+    while improved and evaluations < max_evaluations:
+        improved = False
+        overflow_ids = {item.task_id for item in best.overflow}
+        for candidate in _neighbours(order, overflow_ids):
+            if evaluations >= max_evaluations or time.perf_counter() >= deadline:
+                improved = False
+                break
+            evaluations += 1
+            result = schedule(candidate, free_slots, constraints, plan_id, presorted=True)
+            score = _overflow_score(result)
+            if score < best_score:
+                order, best, best_score = candidate, result, score
+                improved = bool(best.overflow)
+                break
+    if trace is not None and best.trace is None:
+        # Only the chosen order is traced, not every candidate evaluated.
+        trace.clear()
+        best = schedule(order, free_slots, constraints, plan_id, presorted=True, trace=trace)
+    return best
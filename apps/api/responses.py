@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+
+def encode_body(content: Any) -> bytes:
+    return to_json(content)
+
+
+def body_response(body: bytes, status_code: int = 200) -> Response:
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    return body_response(encode_body(content), status_code)
+
+
+# Encoded response bodies keyed by plan_id, or by "tenant/plan_id" and
+# "tenant/date" so one tenant's entries can be dropped with invalidate_prefix().
+# Stored plans are never updated in place, so plan entries only need dropping on
+# delete, or for block bodies, when a task title they join in changes. A body
+# encoded before an invalidation is dropped by put() so a concurrent write
+# cannot leave a stale entry behind.
+class BodyCache:
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._bodies: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key: str, body: bytes, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            if len(self._bodies) > self._max_entries:
+                self._bodies.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._bodies.pop(key, None)
+            self._generation += 1
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._bodies if key.startswith(prefix)]:
+                del self._bodies[key]
+            self._generation += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bodies.clear()
+            self._generation += 1
+
+
+PLAN_BODIES = BodyCache(1024)
+BLOCK_BODIES = BodyCache(1024)
+DAY_BODIES = BodyCache(366)
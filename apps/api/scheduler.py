@@ -1,11 +1,19 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from datetime import date, datetime, time, timedelta
+from datetime import date, datetime, time, timedelta, tzinfo
 from typing import Iterable
 from zoneinfo import ZoneInfo
 
 from .schemas import Constraints, Event, OverflowItem, PlanBlock, Task, WarningItem
+from .tracing import (
+    BREAK_NOT_FIT,
+    PLACED,
+    SKIP_BELOW_MIN_BLOCK,
+    SKIP_EMPTY_SLOT,
+    SKIP_NOT_SPLITTABLE,
+    ScheduleTrace,
+)
 
 
 @dataclass
@@ -13,43 +21,48 @@ class ScheduleResult:
     blocks: list[PlanBlock]
     overflow: list[OverflowItem]
     warnings: list[WarningItem]
+    trace: list[dict] | None = None
 
 
-def _subtract_events(
+def _event_interval(event: Event, tz: tzinfo | None) -> tuple[datetime, datetime]:
+    # Normalize event times to match the timezone of slots
+    if tz is None:
+        # If slots are naive, use event times as-is
+        return event.start_at, event.end_at
+    if event.start_at.tzinfo is None:
+        # If naive, assume it's in the target timezone
+        return event.start_at.replace(tzinfo=tz), event.end_at.replace(tzinfo=tz)
+    # If aware, convert to target timezone
+    return event.start_at.astimezone(tz), event.end_at.astimezone(tz)
+
+
+def _subtract_intervals(
     slots: list[tuple[datetime, datetime]],
-    events: Iterable[Event],
+    intervals: Iterable[tuple[datetime, datetime]],
 ) -> list[tuple[datetime, datetime]]:
     remaining = slots
-    for event in events:
-        # Normalize event times to match the timezone of slots
-        if slots and slots[0][0].tzinfo is not None:
-            tzinfo = slots[0][0].tzinfo
-            if event.start_at.tzinfo is None:
-                # If naive, assume it's in the target timezone
-                event_start = event.start_at.replace(tzinfo=tzinfo)
-                event_end = event.end_at.replace(tzinfo=tzinfo)
-            else:
-                # If aware, convert to target timezone
-                event_start = event.start_at.astimezone(tzinfo)
-                event_end = event.end_at.astimezone(tzinfo)
-        else:
-            # If slots are naive, use event times as-is
-            event_start = event.start_at
-            event_end = event.end_at
-
+    for busy_start, busy_end in intervals:
         updated: list[tuple[datetime, datetime]] = []
         for slot_start, slot_end in remaining:
-            if event_end <= slot_start or event_start >= slot_end:
+            if busy_end <= slot_start or busy_start >= slot_end:
                 updated.append((slot_start, slot_end))
                 continue
-            if event_start > slot_start:
-                updated.append((slot_start, event_start))
-            if event_end < slot_end:
-                updated.append((event_end, slot_end))
+            if busy_start > slot_start:
+                updated.append((slot_start, busy_start))
+            if busy_end < slot_end:
+                updated.append((busy_end, slot_end))
         remaining = updated
     return remaining
 
 
+def _subtract_events(
+    slots: list[tuple[datetime, datetime]],
+    events: Iterable[Event],
+) -> list[tuple[datetime, datetime]]:
+    tzinfo = slots[0][0].tzinfo if slots else None
+    return _subtract_intervals(slots, (_event_interval(event, tzinfo) for event in events))
+
+
 def _apply_buffer(
     slots: list[tuple[datetime, datetime]],
     buffer_ratio: float,
@@ -67,7 +80,7 @@ def _apply_buffer(
         slot_minutes = int((end - start).total_seconds() / 60)
         if slot_minutes <= buffer_remaining:
             buffer_blocks.append(
-                PlanBlock(
+                PlanBlock.model_construct(
                     block_id="",
                     plan_id="",
                     start_at=start,
@@ -83,7 +96,7 @@ def _apply_buffer(
         else:
             buffer_start = end - timedelta(minutes=buffer_remaining)
             buffer_blocks.append(
-                PlanBlock(
+                PlanBlock.model_construct(
                     block_id="",
                     plan_id="",
                     start_at=buffer_start,
@@ -119,11 +132,25 @@ def build_free_slots(
     return _subtract_events(slots, events)
 
 
+def _offset(moment: datetime, origin: datetime) -> int:
+    return int((moment - origin).total_seconds())
+
+
+def task_order(task: Task) -> tuple:
+    return (
+        -task.priority,
+        task.due_at or datetime.max.replace(tzinfo=task.created_at.tzinfo),
+        task.created_at,
+    )
+
+
 def schedule(
     tasks: Iterable[Task],
     free_slots: list[tuple[datetime, datetime]],
     constraints: Constraints,
     plan_id: str,
+    presorted: bool = False,
+    trace: ScheduleTrace | None = None,
 ) -> ScheduleResult:
     blocks: list[PlanBlock] = []
     overflow: list[OverflowItem] = []
@@ -138,17 +165,11 @@ def schedule(
         )
 
     working_slots = buffer_slots
-    tasks_sorted = sorted(
-        tasks,
-        key=lambda task: (
-            -task.priority,
-            task.due_at or datetime.max.replace(tzinfo=task.created_at.tzinfo),
-            task.created_at,
-        ),
-    )
+    tasks_sorted = list(tasks) if presorted else sorted(tasks, key=task_order)
 
     slots = working_slots[:]
-    for task in tasks_sorted:
+    origin = free_slots[0][0] if free_slots else None
+    for task_index, task in enumerate(tasks_sorted):
         remaining = task.estimate_minutes
         min_block = task.min_block_minutes or 30
         allocated = False
@@ -157,19 +178,27 @@ def schedule(
             slot_start, slot_end = slots[slot_index]
             slot_minutes = int((slot_end - slot_start).total_seconds() / 60)
             if slot_minutes <= 0:
+                if trace is not None:
+                    trace.record(task_index, _offset(slot_start, origin), SKIP_EMPTY_SLOT)
                 slot_index += 1
                 continue
             if not task.splittable and remaining > slot_minutes:
+                if trace is not None:
+                    trace.record(task_index, _offset(slot_start, origin), SKIP_NOT_SPLITTABLE)
                 slot_index += 1
                 continue
             chunk = min(remaining, slot_minutes, constraints.focus_max_minutes)
             if task.splittable and chunk < min_block and remaining > min_block:
+                if trace is not None:
+                    trace.record(task_index, _offset(slot_start, origin), SKIP_BELOW_MIN_BLOCK)
                 slot_index += 1
                 continue
+            if trace is not None:
+                trace.record(task_index, _offset(slot_start, origin), PLACED)
             work_start = slot_start
             work_end = slot_start + timedelta(minutes=chunk)
             blocks.append(
-                PlanBlock(
+                PlanBlock.model_construct(
                     block_id="",
                     plan_id=plan_id,
                     start_at=work_start,
@@ -189,7 +218,7 @@ def schedule(
                     break_end = slot_start + timedelta(minutes=constraints.break_minutes)
                     if break_end <= slot_end:
                         blocks.append(
-                            PlanBlock(
+                            PlanBlock.model_construct(
                                 block_id="",
                                 plan_id=plan_id,
                                 start_at=slot_start,
@@ -202,6 +231,8 @@ def schedule(
                         )
                         slot_start = break_end
                     else:
+                        if trace is not None:
+                            trace.record(task_index, _offset(slot_start, origin), BREAK_NOT_FIT)
                         warnings.append(
                             WarningItem(
                                 message_id="W-0210",
@@ -234,7 +265,26 @@ def schedule(
             )
         )
 
+    trace_entries = None
+    if trace is not None and origin is not None:
+        trace_entries = trace.summarize(
+            tasks_sorted, origin, {item.task_id for item in overflow}
+        )
+        by_task = {entry["task_id"]: entry for entry in trace_entries}
+        for block in blocks:
+            if block.kind != "work":
+                continue
+            entry = by_task[block.task_id]
+            block.meta = {
+                "assigned_rule": "priority_first",
+                "split_count": entry["split_count"],
+                "slots_considered": entry["slots_considered"],
+                "skips": dict(entry["skips"]),
+            }
+
     blocks.extend(buffer_blocks)
     blocks.sort(key=lambda block: block.start_at)
 
-    return ScheduleResult(blocks=blocks, overflow=overflow, warnings=warnings)
+    return ScheduleResult(
+        blocks=blocks, overflow=overflow, warnings=warnings, trace=trace_entries
+    )
@@ -6,6 +6,9 @@ from typing import Literal
 from pydantic import BaseModel, ConfigDict, Field
 
 
+DEFAULT_TENANT = "default"
+
+
 class TaskBase(BaseModel):
     title: str = Field(min_length=1, max_length=100)
     description: str | None = Field(default=None, max_length=2000)
@@ -18,6 +21,8 @@ class TaskBase(BaseModel):
     splittable: bool = True
     min_block_minutes: int | None = None
     tags: list[str] | None = None
+    assignee: str | None = Field(default=None, min_length=1, max_length=100)
+    candidate_assignees: list[str] | None = None
 
 
 class TaskCreateRequest(TaskBase):
@@ -37,12 +42,15 @@ class TaskUpdateRequest(BaseModel):
     splittable: bool | None = None
     min_block_minutes: int | None = None
     tags: list[str] | None = None
+    assignee: str | None = Field(default=None, min_length=1, max_length=100)
+    candidate_assignees: list[str] | None = None
 
 
 class Task(TaskBase):
     model_config = ConfigDict(from_attributes=True)
 
     task_id: str
+    tenant_id: str = DEFAULT_TENANT
     status: Literal["open", "done", "archived"]
     created_at: datetime
     updated_at: datetime
@@ -53,6 +61,7 @@ class EventBase(BaseModel):
     start_at: datetime
     end_at: datetime
     description: str | None = Field(default=None, max_length=2000)
+    owner: str | None = Field(default=None, min_length=1, max_length=100)
 
 
 class EventCreateRequest(EventBase):
@@ -64,17 +73,29 @@ class EventUpdateRequest(BaseModel):
     start_at: datetime | None = None
     end_at: datetime | None = None
     description: str | None = Field(default=None, max_length=2000)
+    owner: str | None = Field(default=None, min_length=1, max_length=100)
 
 
 class Event(EventBase):
     model_config = ConfigDict(from_attributes=True)
 
     event_id: str
+    tenant_id: str = DEFAULT_TENANT
     locked: bool
     created_at: datetime
     updated_at: datetime
 
 
+class TimeInterval(BaseModel):
+    start_at: datetime
+    end_at: datetime
+
+
+class FreeBusy(BaseModel):
+    busy: list[TimeInterval]
+    free: list[TimeInterval]
+
+
 class WorkingHour(BaseModel):
     start: str
     end: str
@@ -91,6 +112,22 @@ class PlanGenerateRequest(BaseModel):
     timezone: str
     working_hours: list[WorkingHour]
     constraints: Constraints | None = None
+    mode: Literal["greedy", "optimize"] = "greedy"
+    budget_ms: int = 200
+    trace: bool = False
+
+
+class TeamMember(BaseModel):
+    member_id: str = Field(min_length=1, max_length=100)
+    working_hours: list[WorkingHour]
+
+
+class TeamPlanGenerateRequest(BaseModel):
+    date: date
+    timezone: str
+    members: list[TeamMember]
+    constraints: Constraints | None = None
+    trace: bool = False
 
 
 class PlanParams(BaseModel):
@@ -102,10 +139,12 @@ class Plan(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     plan_id: str
+    tenant_id: str = DEFAULT_TENANT
     date: date
     timezone: str
     params: PlanParams
     summary: dict | None = None
+    member: str | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -114,8 +153,10 @@ class PlanListItem(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     plan_id: str
+    tenant_id: str = DEFAULT_TENANT
     date: date
     timezone: str
+    member: str | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -1,17 +1,171 @@
 from __future__ import annotations
 
+import threading
 from dataclasses import dataclass, field
-from typing import Dict, List
+from datetime import date
+from operator import attrgetter
+from typing import Callable, Dict, Generic, Hashable, Iterable, TypeVar
+from zoneinfo import ZoneInfo
 
-from .schemas import Event, Plan, PlanBlock, Task
+from .blockstore import PlanBlockStore
+from .intervals import BusyIntervalIndex
+from .schemas import Event, Plan, Task
+
+
+T = TypeVar("T", Task, Event, Plan)
+
+_TOKYO = ZoneInfo("Asia/Tokyo")
+
+
+def _event_day(event: Event) -> date:
+    return event.start_at.astimezone(_TOKYO).date()
+
+
+# Entities keyed by ID, with a dict per tenant kept alongside so a scan for one
+# tenant never touches another tenant's rows. Lookups by ID, the journal and
+# the cold tier keep using the flat mapping. Partition dicts are never
+# replaced, so indexes built over one stay live. Only the mutating methods the
+# store actually uses are overridden.
+#
+# A tenant can also be deferred with a loader that returns its rows. Its rows
+# are absent from both mappings until load() runs, which partition() and the
+# store's load_tenant() do on first use, so a restart only materializes the
+# tenants that are actually asked for.
+#
+# A map may also keep one secondary index from (tenant, index_key(row)) to rows,
+# so that a day view finds a tenant's open tasks, or one date's events or plans,
+# with a single lookup. It is maintained by the same methods as the partitions.
+class TenantMap(dict, Generic[T]):
+    def __init__(self, index_key: Callable[[T], Hashable] | None = None) -> None:
+        super().__init__()
+        self._partitions: dict[str, dict[str, T]] = {}
+        self._deferred: dict[str, Callable[[], dict[str, T]]] = {}
+        self._load_lock = threading.Lock()
+        self._index_key = index_key
+        self._index: dict[tuple[str, Hashable], dict[str, T]] = {}
+
+    def defer(self, tenant_id: str, load: Callable[[], dict[str, T]]) -> None:
+        self._deferred[tenant_id] = load
+
+    def load(self, tenant_id: str) -> None:
+        if tenant_id not in self._deferred:
+            return
+        with self._load_lock:
+            load = self._deferred.get(tenant_id)
+            if load is None:
+                return
+            rows = load()
+            super().update(rows)
+            self._partitions.setdefault(tenant_id, {}).update(rows)
+            for key, value in rows.items():
+                self._reindex(key, None, value)
+            del self._deferred[tenant_id]
+
+    def load_all(self) -> None:
+        for tenant_id in list(self._deferred):
+            self.load(tenant_id)
+
+    def partition(self, tenant_id: str, create: bool = False) -> dict[str, T]:
+        self.load(tenant_id)
+        partition = self._partitions.get(tenant_id)
+        if partition is None:
+            if not create:
+                return {}
+            partition = self._partitions.setdefault(tenant_id, {})
+        return partition
+
+    def lookup(self, tenant_id: str, index_key: Hashable) -> list[T]:
+        self.load(tenant_id)
+        return list(self._index.get((tenant_id, index_key), {}).values())
+
+    def _reindex(self, key: str, previous: T | None, value: T | None) -> None:
+        if self._index_key is None:
+            return
+        if previous is not None:
+            index_key = (previous.tenant_id, self._index_key(previous))
+            if value is not None and index_key == (value.tenant_id, self._index_key(value)):
+                self._index[index_key][key] = value
+                return
+            rows = self._index.get(index_key)
+            if rows is not None:
+                rows.pop(key, None)
+                if not rows:
+                    del self._index[index_key]
+        if value is not None:
+            self._index.setdefault((value.tenant_id, self._index_key(value)), {})[key] = value
+
+    def tenants(self) -> list[str]:
+        tenant_ids = [tenant_id for tenant_id, partition in self._partitions.items() if partition]
+        tenant_ids.extend(tenant_id for tenant_id in self._deferred if not self._partitions.get(tenant_id))
+        return tenant_ids
+
+    def __setitem__(self, key: str, value: T) -> None:
+        previous = dict.get(self, key)
+        if previous is not None and previous.tenant_id != value.tenant_id:
+            self._partitions[previous.tenant_id].pop(key, None)
+        super().__setitem__(key, value)
+        self.partition(value.tenant_id, create=True)[key] = value
+        self._reindex(key, previous, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.pop(key)
+
+    def pop(self, key: str, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = super().pop(key)
+        self._partitions[value.tenant_id].pop(key, None)
+        self._reindex(key, value, None)
+        return value
+
+    def clear(self) -> None:
+        self._deferred.clear()
+        self._index.clear()
+        super().clear()
+        for partition in self._partitions.values():
+            partition.clear()
+
+    def update(self, items: Iterable[tuple[str, T]]) -> None:
+        for key, value in items:
+            self[key] = value
 
 
 @dataclass
 class InMemoryStore:
-    tasks: Dict[str, Task] = field(default_factory=dict)
-    events: Dict[str, Event] = field(default_factory=dict)
-    plans: Dict[str, Plan] = field(default_factory=dict)
-    plan_blocks: Dict[str, List[PlanBlock]] = field(default_factory=dict)
+    tasks: TenantMap[Task] = field(default_factory=lambda: TenantMap(attrgetter("status")))
+    events: TenantMap[Event] = field(default_factory=lambda: TenantMap(_event_day))
+    plans: TenantMap[Plan] = field(default_factory=lambda: TenantMap(attrgetter("date")))
+    sequence: int = 0
+    plan_blocks: PlanBlockStore = field(init=False)
+    event_indexes: Dict[str, BusyIntervalIndex] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.plan_blocks = PlanBlockStore(self.tasks)
+        self.event_indexes = {}
+
+    def load_tenant(self, tenant_id: str) -> None:
+        for entities in (self.tasks, self.events, self.plans):
+            entities.load(tenant_id)
+
+    def load_all(self) -> None:
+        for entities in (self.tasks, self.events, self.plans):
+            entities.load_all()
+
+    def event_index(self, tenant_id: str) -> BusyIntervalIndex:
+        index = self.event_indexes.get(tenant_id)
+        if index is None:
+            index = BusyIntervalIndex(
+                self.events.partition(tenant_id, create=True), ZoneInfo("Asia/Tokyo")
+            )
+            index = self.event_indexes.setdefault(tenant_id, index)
+        return index
+
+    def invalidate_events(self, tenant_id: str | None = None) -> None:
+        for key, index in self.event_indexes.items():
+            if tenant_id is None or key == tenant_id:
+                index.invalidate()
 
 
 STORE = InMemoryStore()
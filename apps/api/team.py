@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable
+
+from .scheduler import task_order
+from .schemas import Constraints, Task
+
+
+def _minutes(start: datetime, end: datetime) -> int:
+    return int((end - start).total_seconds() / 60)
+
+
+@dataclass
+class MemberSlots:
+    member_id: str
+    free_slots: list[tuple[datetime, datetime]]
+    capacity: int = 0
+    slot_heap: list[int] = field(default_factory=list)
+    version: int = 0
+
+    @classmethod
+    def build(
+        cls,
+        member_id: str,
+        free_slots: list[tuple[datetime, datetime]],
+        constraints: Constraints,
+    ) -> MemberSlots:
+        lengths = [_minutes(start, end) for start, end in free_slots]
+        total = sum(lengths)
+        slot_heap = [-length for length in lengths if length > 0]
+        heapq.heapify(slot_heap)
+        return cls(
+            member_id=member_id,
+            free_slots=free_slots,
+            capacity=total - int(total * constraints.buffer_ratio),
+            slot_heap=slot_heap,
+        )
+
+    def largest_slot(self) -> int:
+        return -self.slot_heap[0] if self.slot_heap else 0
+
+    def fits(self, task: Task) -> bool:
+        if task.estimate_minutes > self.capacity:
+            return False
+        return task.splittable or task.estimate_minutes <= self.largest_slot()
+
+    def reserve(self, task: Task, constraints: Constraints) -> None:
+        remaining = task.estimate_minutes
+        while remaining > 0 and self.slot_heap:
+            largest = -heapq.heappop(self.slot_heap)
+            if not task.splittable and largest < remaining:
+                heapq.heappush(self.slot_heap, -largest)
+                break
+            taken = min(largest, remaining)
+            remaining -= taken
+            rest = largest - taken - constraints.break_minutes
+            if rest > 0:
+                heapq.heappush(self.slot_heap, -rest)
+        self.capacity = max(0, self.capacity - task.estimate_minutes)
+        self.version += 1
+
+
+# Tasks are taken in schedule() order and each goes to the eligible member with
+# the most remaining capacity that can hold it (for non-splittable tasks, whose
+# largest free slot is long enough). Open tasks without an assignee or
+# candidates go through a lazily updated max-heap over all members, so a pick
+# costs O(log members) instead of a scan. Tasks that fit nobody still go to the
+# roomiest eligible member, where schedule() reports them as overflow. Tasks
+# whose assignee or candidates are all outside the team are returned separately
+# so the caller can report them.
+def assign_team_tasks(
+    tasks: Iterable[Task],
+    members: list[MemberSlots],
+    constraints: Constraints,
+) -> tuple[dict[str, list[Task]], list[Task]]:
+    assignments: dict[str, list[Task]] = {member.member_id: [] for member in members}
+    unassigned: list[Task] = []
+    if not members:
+        return assignments, sorted(tasks, key=task_order)
+    by_id = {member.member_id: index for index, member in enumerate(members)}
+    ranking = [(-member.capacity, index, member.version) for index, member in enumerate(members)]
+    heapq.heapify(ranking)
+
+    for task in sorted(tasks, key=task_order):
+        if task.assignee is not None:
+            if task.assignee not in by_id:
+                unassigned.append(task)
+                continue
+            candidates = [by_id[task.assignee]]
+        elif task.candidate_assignees:
+            candidates = [by_id[member_id] for member_id in task.candidate_assignees if member_id in by_id]
+            if not candidates:
+                unassigned.append(task)
+                continue
+        else:
+            candidates = None
+
+        if candidates is not None:
+            fitting = [index for index in candidates if members[index].fits(task)]
+            chosen = min(fitting or candidates, key=lambda index: (-members[index].capacity, index))
+        else:
+            held: list[tuple[int, int, int]] = []
+            chosen = None
+            while ranking:
+                entry = heapq.heappop(ranking)
+                _, index, version = entry
+                if version != members[index].version:
+                    continue
+                held.append(entry)
+                if members[index].capacity < task.estimate_minutes:
+                    break
+                if members[index].fits(task):
+                    chosen = index
+                    break
+            if chosen is None:
+                chosen = held[0][1]
+            for entry in held:
+                heapq.heappush(ranking, entry)
+
+        member = members[chosen]
+        member.reserve(task, constraints)
+        heapq.heappush(ranking, (-member.capacity, chosen, member.version))
+        assignments[member.member_id].append(task)
+
+    return assignments, unassigned
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+
+from fastapi.responses import Response
+
+from .errors import ApiError, FieldError, error_response
+from .schemas import DEFAULT_TENANT
+from .storage import STORE, InMemoryStore
+
+
+_TENANT_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+# Each worker URL is placed on the ring at replicas points, and a tenant belongs
+# to the first point at or after its own hash. Adding or removing a worker only
+# moves the tenants on the arcs next to its points.
+class HashRing:
+    def __init__(self, nodes: list[str], replicas: int = 64) -> None:
+        points = sorted((_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas))
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def __bool__(self) -> bool:
+        return bool(self._keys)
+
+    def __contains__(self, node: object) -> bool:
+        return node in self._nodes
+
+    def owner(self, tenant_id: str) -> str:
+        index = bisect_right(self._keys, _hash(tenant_id)) % len(self._keys)
+        return self._nodes[index]
+
+
+# A worker whose own URL is missing from the ring would redirect every request
+# away, so a misconfigured worker refuses to start instead.
+def check_worker(ring: HashRing, worker_url: str | None) -> None:
+    if ring and worker_url not in ring:
+        raise ValueError(f"TENANT_WORKER_URL {worker_url!r} is not one of TENANT_WORKERS")
+
+
+@dataclass
+class TenantLatency:
+    requests: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    average_seconds: float = 0.0
+
+
+class TenantStats:
+    def __init__(self, store: InMemoryStore, max_tenants: int) -> None:
+        self._store = store
+        self._max_tenants = max_tenants
+        self._latency: dict[str, TenantLatency] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, tenant_id: str, seconds: float) -> None:
+        with self._lock:
+            latency = self._latency.get(tenant_id)
+            if latency is None:
+                if len(self._latency) >= self._max_tenants:
+                    return
+                latency = self._latency[tenant_id] = TenantLatency(average_seconds=seconds)
+            latency.requests += 1
+            latency.total_seconds += seconds
+            latency.max_seconds = max(latency.max_seconds, seconds)
+            latency.average_seconds += (seconds - latency.average_seconds) * 0.2
+
+    def snapshot(self) -> list[dict]:
+        store = self._store
+        with self._lock:
+            latency = {tenant_id: TenantLatency(**vars(entry)) for tenant_id, entry in self._latency.items()}
+        tenant_ids = set(latency)
+        tenant_ids.update(store.tasks.tenants(), store.events.tenants(), store.plans.tenants())
+        rows = []
+        for tenant_id in sorted(tenant_ids):
+            plans = store.plans.partition(tenant_id)
+            entry = latency.get(tenant_id, TenantLatency())
+            rows.append(
+                {
+                    "tenant_id": tenant_id,
+                    "tasks": len(store.tasks.partition(tenant_id)),
+                    "events": len(store.events.partition(tenant_id)),
+                    "plans": len(plans),
+                    "blocks": sum(len(store.plan_blocks.raw(plan_id) or ()) for plan_id in list(plans)),
+                    "requests": entry.requests,
+                    "average_seconds": round(entry.average_seconds, 4),
+                    "mean_seconds": round(entry.total_seconds / entry.requests, 4) if entry.requests else 0.0,
+                    "max_seconds": round(entry.max_seconds, 4),
+                }
+            )
+        return rows
+
+
+# Resolves the X-Tenant-ID header (default tenant when absent) into
+# request.state.tenant_id. When a ring of worker URLs is configured, requests
+# for tenants owned by another worker get a 307 to that worker, so any worker
+# can front the whole set; /stats/ always answers for the local worker.
+# Response latency is recorded per tenant; event-stream responses are left out
+# since they stay open by design.
+class TenantMiddleware:
+    def __init__(self, app, ring: HashRing, worker_url: str | None, stats: TenantStats) -> None:
+        self.app = app
+        self.ring = ring
+        self.worker_url = worker_url
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        tenant_id = DEFAULT_TENANT
+        for name, value in scope["headers"]:
+            if name == b"x-tenant-id":
+                tenant_id = value.decode("latin-1")
+                break
+        if not _TENANT_ID.fullmatch(tenant_id):
+            response = error_response(
+                ApiError(
+                    status_code=400,
+                    message_id="E-0400",
+                    message="入力内容が不正です",
+                    field_errors=[FieldError("X-Tenant-ID", "E-0400", "テナントIDを確認してください")],
+                )
+            )
+            await response(scope, receive, send)
+            return
+        if self.ring and scope["method"] != "OPTIONS" and not scope["path"].startswith("/stats/"):
+            owner = self.ring.owner(tenant_id)
+            if owner != self.worker_url:
+                location = owner.rstrip("/") + scope["path"]
+                if scope["query_string"]:
+                    location += "?" + scope["query_string"].decode("latin-1")
+                response = Response(status_code=307, headers={"Location": location})
+                await response(scope, receive, send)
+                return
+        scope.setdefault("state", {})["tenant_id"] = tenant_id
+
+        started_at = time.perf_counter()
+        streaming = False
+
+        async def observe(message) -> None:
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not streaming:
+                self.stats.observe(tenant_id, time.perf_counter() - started_at)
+
+        await self.app(scope, receive, observe)
+
+
+TENANT_RING = HashRing(
+    [url.strip() for url in os.environ.get("TENANT_WORKERS", "").split(",") if url.strip()],
+    int(os.environ.get("TENANT_RING_REPLICAS", "64")),
+)
+TENANT_WORKER_URL = os.environ.get("TENANT_WORKER_URL")
+TENANT_STATS = TenantStats(STORE, int(os.environ.get("TENANT_STATS_MAX_TENANTS", "10000")))
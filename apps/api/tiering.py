@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from .blockstore import CompactPlanBlocks, decode_compact, encode_compact, plan_base
+from .durability import fsync_directory, lock_directory
+from .schemas import Plan, PlanBlock, PlanListItem
+from .storage import STORE, InMemoryStore
+
+
+_RECORD = struct.Struct("<IIB")
+_PLAN_PARTS = struct.Struct("<II")
+_PUT = 0
+_DELETE = 1
+_SEGMENT_FILE = "plans.seg"
+_LOCK_FILE = "plans.lock"
+_COMPACT_MIN_BYTES = 1 << 20
+
+
+def _summary(plan: Plan) -> PlanListItem:
+    return PlanListItem(
+        plan_id=plan.plan_id,
+        tenant_id=plan.tenant_id,
+        date=plan.date,
+        timezone=plan.timezone,
+        member=plan.member,
+        created_at=plan.created_at,
+        updated_at=plan.updated_at,
+    )
+
+
+# Plans older than cold_after_days, or the oldest plans once the hot store holds
+# more than hot_max_blocks blocks, are appended to a segment file and dropped
+# from STORE. Records are framed like the journal: (length, crc32, flag) then
+# the payload. Only PlanListItem summaries and file offsets stay resident; cold
+# reads slice the memory-mapped segment and keep recently decoded plans in an
+# LRU cache. Opening walks the mapped segment and decodes only the summary of
+# each record. Deleted records are dead bytes; once they outweigh the live ones
+# (and exceed _COMPACT_MIN_BYTES) the live records are copied to a fresh
+# segment, on open and after each spill pass, so the file stays under twice
+# the live data plus that minimum. Summaries are also indexed by tenant for the plan list and by
+# (tenant, date) for the day view. Spilling scans every hot plan, so it runs on
+# open and then every spill_interval seconds on a background thread rather than
+# per request; the hot store may exceed hot_max_blocks until the next pass.
+class ColdPlanStore:
+    def __init__(
+        self,
+        store: InMemoryStore,
+        data_dir: str | None,
+        cold_after_days: int,
+        hot_max_blocks: int,
+        cache_size: int,
+        spill_interval: float,
+    ) -> None:
+        self._store = store
+        self._dir = Path(data_dir) if data_dir else None
+        self._cold_after = timedelta(days=cold_after_days)
+        self._hot_max_blocks = hot_max_blocks
+        self._cache_size = cache_size
+        self._spill_interval = spill_interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._index: dict[str, tuple[int, int]] = {}
+        self._dead = 0
+        self._summaries: dict[str, PlanListItem] = {}
+        self._tenants: dict[str, dict[str, PlanListItem]] = {}
+        self._days: dict[tuple[str, date], dict[str, PlanListItem]] = {}
+        self._cache: OrderedDict[str, tuple[Plan, CompactPlanBlocks, list[tuple[str, str | None]]]] = OrderedDict()
+        self._file = None
+        self._lock_file = None
+        self._mapped: mmap.mmap | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._dir is not None
+
+    def open(self) -> None:
+        if self._dir is None:
+            return
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._lock_file = lock_directory(self._dir, _LOCK_FILE)
+        self._file = open(self._dir / _SEGMENT_FILE, "a+b")
+        self._remap()
+        length = len(self._mapped) if self._mapped is not None else 0
+        offset = 0
+        live = 0
+        if self._mapped is not None:
+            with memoryview(self._mapped) as view:
+                while offset + _RECORD.size <= length:
+                    size, checksum, flag = _RECORD.unpack_from(view, offset)
+                    start = offset + _RECORD.size
+                    if start + size > length or zlib.crc32(view[start : start + size]) != checksum:
+                        break
+                    if flag == _DELETE:
+                        plan_id = bytes(view[start : start + size]).decode()
+                        position = self._index.pop(plan_id, None)
+                        if position is not None:
+                            live -= _RECORD.size + position[1]
+                        self._drop_summary(plan_id)
+                    else:
+                        summary = _decode_summary(view[start : start + size])
+                        position = self._index.get(summary.plan_id)
+                        if position is not None:
+                            live -= _RECORD.size + position[1]
+                        self._index[summary.plan_id] = (start, size)
+                        self._put_summary(summary)
+                        live += _RECORD.size + size
+                    offset = start + size
+        if offset < length:
+            self._mapped.close()
+            self._mapped = None
+            self._file.truncate(offset)
+            self._remap()
+        self._dead = offset - live
+        self._compact_if_needed()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._spill_loop, name="cold-spill", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._mapped is not None:
+                self._mapped.close()
+                self._mapped = None
+            self._file.close()
+            self._file = None
+            self._lock_file.close()
+            self._lock_file = None
+
+    def __contains__(self, plan_id: object) -> bool:
+        return plan_id in self._index
+
+    def summaries(self, tenant_id: str) -> list[PlanListItem]:
+        return list(self._tenants.get(tenant_id, {}).values())
+
+    def summary(self, plan_id: str) -> PlanListItem | None:
+        return self._summaries.get(plan_id)
+
+    def on_day(self, tenant_id: str, day: date) -> list[PlanListItem]:
+        return list(self._days.get((tenant_id, day), {}).values())
+
+    def _put_summary(self, summary: PlanListItem) -> None:
+        self._drop_summary(summary.plan_id)
+        self._summaries[summary.plan_id] = summary
+        self._tenants.setdefault(summary.tenant_id, {})[summary.plan_id] = summary
+        self._days.setdefault((summary.tenant_id, summary.date), {})[summary.plan_id] = summary
+
+    def _drop_summary(self, plan_id: str) -> None:
+        summary = self._summaries.pop(plan_id, None)
+        if summary is None:
+            return
+        tenant_plans = self._tenants[summary.tenant_id]
+        del tenant_plans[plan_id]
+        if not tenant_plans:
+            del self._tenants[summary.tenant_id]
+        day_key = (summary.tenant_id, summary.date)
+        plans = self._days[day_key]
+        del plans[plan_id]
+        if not plans:
+            del self._days[day_key]
+
+    def get_plan(self, plan_id: str) -> Plan | None:
+        record = self._load(plan_id)
+        return record[0] if record else None
+
+    def get_blocks(self, plan_id: str) -> list[PlanBlock] | None:
+        record = self._load(plan_id)
+        if record is None:
+            return None
+        _, packed, task_table = record
+        return self._store.plan_blocks.unpack(plan_id, packed, task_table)
+
+    def delete(self, plan_id: str) -> bool:
+        if self._file is None:
+            return False
+        with self._lock:
+            if plan_id not in self._index:
+                return False
+            self._append([(_DELETE, plan_id.encode())])
+            _, size = self._index.pop(plan_id)
+            self._dead += 2 * _RECORD.size + size + len(plan_id.encode())
+            self._drop_summary(plan_id)
+            self._cache.pop(plan_id, None)
+        return True
+
+    def spill(self, today: date) -> int:
+        if self._file is None:
+            return 0
+        store = self._store
+        store.plans.load_all()
+        cutoff = today - self._cold_after
+        hot_blocks = store.plan_blocks.block_count
+        victims: list[Plan] = []
+        for plan in list(store.plans.values()):
+            if plan.date < cutoff or hot_blocks > self._hot_max_blocks:
+                packed = store.plan_blocks.raw(plan.plan_id)
+                hot_blocks -= len(packed) if packed else 0
+                victims.append(plan)
+        if not victims:
+            return 0
+
+        with self._lock:
+            # Moves are not journaled, so a restart puts spilled plans back in
+            # STORE. Those are already in the segment and are only dropped again.
+            moved = [plan for plan in victims if plan.plan_id not in self._index]
+            payloads: list[tuple[int, bytes]] = []
+            for plan in moved:
+                packed = store.plan_blocks.raw(plan.plan_id)
+                if packed is None:
+                    packed = store.plan_blocks.pack(plan_base(plan), [])
+                local, task_table = store.plan_blocks.localize(packed)
+                payloads.append((_PUT, _encode_record(plan, local, task_table)))
+            if payloads:
+                for plan, position in zip(moved, self._append(payloads)):
+                    self._index[plan.plan_id] = position
+                    self._put_summary(_summary(plan))
+                    self._cache.pop(plan.plan_id, None)
+
+            for plan in victims:
+                store.plans.pop(plan.plan_id, None)
+                store.plan_blocks.pop(plan.plan_id)
+        return len(victims)
+
+    def _spill_loop(self) -> None:
+        while not self._stop.wait(self._spill_interval):
+            self.spill(datetime.now(tz=ZoneInfo("Asia/Tokyo")).date())
+            with self._lock:
+                self._compact_if_needed()
+
+    def _compact_if_needed(self) -> None:
+        if self._mapped is None or self._dead < _COMPACT_MIN_BYTES or self._dead * 2 < len(self._mapped):
+            return
+        path = self._dir / _SEGMENT_FILE
+        temp_path = path.with_suffix(".tmp")
+        index: dict[str, tuple[int, int]] = {}
+        offset = 0
+        with open(temp_path, "wb") as file:
+            for plan_id, (start, size) in self._index.items():
+                file.write(self._mapped[start - _RECORD.size : start + size])
+                index[plan_id] = (offset + _RECORD.size, size)
+                offset += _RECORD.size + size
+            file.flush()
+            os.fsync(file.fileno())
+        self._mapped.close()
+        self._mapped = None
+        self._file.close()
+        os.replace(temp_path, path)
+        fsync_directory(self._dir)
+        self._file = open(path, "a+b")
+        self._index = index
+        self._dead = 0
+        self._remap()
+
+    def _append(self, records: list[tuple[int, bytes]]) -> list[tuple[int, int]]:
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        positions: list[tuple[int, int]] = []
+        chunks: list[bytes] = []
+        for flag, payload in records:
+            chunks.append(_RECORD.pack(len(payload), zlib.crc32(payload), flag))
+            chunks.append(payload)
+            positions.append((offset + _RECORD.size, len(payload)))
+            offset += _RECORD.size + len(payload)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._remap()
+        return positions
+
+    def _remap(self) -> None:
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load(self, plan_id: str) -> tuple[Plan, CompactPlanBlocks, list[tuple[str, str | None]]] | None:
+        with self._lock:
+            record = self._cache.get(plan_id)
+            if record is not None:
+                self._cache.move_to_end(plan_id)
+                return record
+            position = self._index.get(plan_id)
+            if position is None or self._mapped is None:
+                return None
+            start, size = position
+            payload = self._mapped[start : start + size]
+            record = _decode_record(payload)
+            self._cache[plan_id] = record
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return record
+
+
+def _encode_record(plan: Plan, packed: CompactPlanBlocks, task_table: list[tuple[str, str | None]]) -> bytes:
+    plan_bytes = plan.model_dump_json().encode()
+    task_table_bytes = json.dumps(task_table).encode()
+    return b"".join(
+        (
+            _PLAN_PARTS.pack(len(plan_bytes), len(task_table_bytes)),
+            plan_bytes,
+            task_table_bytes,
+            encode_compact(plan.plan_id, packed),
+        )
+    )
+
+
+def _decode_summary(payload: memoryview) -> PlanListItem:
+    plan_size, _ = _PLAN_PARTS.unpack_from(payload, 0)
+    return PlanListItem.model_validate_json(bytes(payload[_PLAN_PARTS.size : _PLAN_PARTS.size + plan_size]))
+
+
+# Records written before titles were kept list bare task IDs.
+def _decode_record(payload: bytes) -> tuple[Plan, CompactPlanBlocks, list[tuple[str, str | None]]]:
+    plan_size, task_table_size = _PLAN_PARTS.unpack_from(payload, 0)
+    offset = _PLAN_PARTS.size
+    plan = Plan.model_validate_json(payload[offset : offset + plan_size])
+    offset += plan_size
+    task_table = [
+        (entry, None) if isinstance(entry, str) else tuple(entry)
+        for entry in json.loads(payload[offset : offset + task_table_size])
+    ]
+    offset += task_table_size
+    _, packed, _ = decode_compact(memoryview(payload), offset)
+    return plan, packed, task_table
+
+
+COLD_PLANS = ColdPlanStore(
+    STORE,
+    os.environ.get("PLAN_COLD_DIR"),
+    int(os.environ.get("PLAN_COLD_AFTER_DAYS", "28")),
+    int(os.environ.get("PLAN_HOT_MAX_BLOCKS", "100000")),
+    int(os.environ.get("PLAN_COLD_CACHE_SIZE", "128")),
+    float(os.environ.get("PLAN_SPILL_INTERVAL_SECONDS", "60")),
+)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from .schemas import Task
+
+
+PLACED = 0
+SKIP_EMPTY_SLOT = 1
+SKIP_NOT_SPLITTABLE = 2
+SKIP_BELOW_MIN_BLOCK = 3
+BREAK_NOT_FIT = 4
+
+REASONS = {
+    PLACED: "placed",
+    SKIP_EMPTY_SLOT: "empty_slot",
+    SKIP_NOT_SPLITTABLE: "not_splittable_too_long",
+    SKIP_BELOW_MIN_BLOCK: "below_min_block_minutes",
+    BREAK_NOT_FIT: "break_did_not_fit",
+}
+
+_FIELDS = 3
+
+
+# Decisions are written as (task index, slot start offset in seconds, code)
+# triples into an int array sized up front, so recording costs three stores and
+# no allocation. Records past capacity are counted in dropped.
+class ScheduleTrace:
+    __slots__ = ("_buffer", "_size", "_capacity", "dropped")
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self._buffer = array("i", bytes(array("i").itemsize * _FIELDS * capacity))
+        self._size = 0
+        self._capacity = capacity
+        self.dropped = 0
+
+    def record(self, task_index: int, slot_offset: int, code: int) -> None:
+        size = self._size
+        if size == self._capacity:
+            self.dropped += 1
+            return
+        offset = size * _FIELDS
+        buffer = self._buffer
+        buffer[offset] = task_index
+        buffer[offset + 1] = slot_offset
+        buffer[offset + 2] = code
+        self._size = size + 1
+
+    def clear(self) -> None:
+        self._size = 0
+        self.dropped = 0
+
+    def summarize(self, tasks: list[Task], origin: datetime, overflow_ids: set[str]) -> list[dict]:
+        entries = [
+            {
+                "task_id": task.task_id,
+                "task_title": task.title,
+                "outcome": "placed",
+                "split_count": 0,
+                "slots_considered": 0,
+                "skips": {},
+                "decisions": [],
+            }
+            for task in tasks
+        ]
+        buffer = self._buffer
+        for offset in range(0, self._size * _FIELDS, _FIELDS):
+            task_index, slot_offset, code = buffer[offset : offset + _FIELDS]
+            entry = entries[task_index]
+            reason = REASONS[code]
+            entry["decisions"].append(
+                {
+                    "slot_start": (origin + timedelta(seconds=slot_offset)).isoformat(),
+                    "reason": reason,
+                }
+            )
+            if code == PLACED:
+                entry["split_count"] += 1
+            else:
+                entry["skips"][reason] = entry["skips"].get(reason, 0) + 1
+            if code != BREAK_NOT_FIT:
+                entry["slots_considered"] += 1
+        for task, entry in zip(tasks, entries):
+            if task.task_id in overflow_ids:
+                entry["outcome"] = "partial" if entry["split_count"] else "overflow"
+        return entries
+
+
+class TraceStore:
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._traces: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, plan_id: str, trace: dict) -> None:
+        with self._lock:
+            self._traces[plan_id] = trace
+            if len(self._traces) > self._max_entries:
+                self._traces.popitem(last=False)
+
+    def get(self, plan_id: str) -> dict | None:
+        return self._traces.get(plan_id)
+
+    def pop(self, plan_id: str) -> None:
+        with self._lock:
+            self._traces.pop(plan_id, None)
+
+
+def sample_trace(forced: bool = False) -> ScheduleTrace | None:
+    if forced or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE):
+        return ScheduleTrace()
+    return None
+
+
+TRACE_SAMPLE_RATE = float(os.environ.get("SCHEDULE_TRACE_SAMPLE_RATE", "0"))
+TRACES = TraceStore(int(os.environ.get("SCHEDULE_TRACE_MAX_PLANS", "1000")))
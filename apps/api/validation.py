@@ -1,9 +1,22 @@
 from __future__ import annotations
 
-from datetime import time
+from datetime import date, time
 
 from .errors import ApiError, FieldError
-from .schemas import Constraints, EventUpdateRequest, PlanGenerateRequest, TaskUpdateRequest
+from .schemas import (
+    Constraints,
+    EventUpdateRequest,
+    PlanGenerateRequest,
+    TaskUpdateRequest,
+    TeamPlanGenerateRequest,
+    WorkingHour,
+)
+
+
+FREEBUSY_MAX_DAYS = 62
+TEAM_MAX_MEMBERS = 50
+OPTIMIZE_MIN_BUDGET_MS = 10
+OPTIMIZE_MAX_BUDGET_MS = 5000
 
 
 def _time_from_hhmm(value: str) -> time | None:
@@ -20,6 +33,66 @@ def _time_from_hhmm(value: str) -> time | None:
         return None
 
 
+def _normalize_working_hours(
+    working_hours: list[WorkingHour],
+    field_errors: list[FieldError],
+    field: str = "working_hours",
+) -> list[tuple[time, time]]:
+    if not (1 <= len(working_hours) <= 3):
+        field_errors.append(
+            FieldError(field, "E-0400", "1〜3件で入力してください")
+        )
+
+    working_slots: list[tuple[time, time]] = []
+    for index, slot in enumerate(working_hours):
+        start = _time_from_hhmm(slot.start)
+        end = _time_from_hhmm(slot.end)
+        if start is None:
+            field_errors.append(
+                FieldError(f"{field}.{index}.start", "E-0400", "開始時刻を確認してください")
+            )
+        if end is None:
+            field_errors.append(
+                FieldError(f"{field}.{index}.end", "E-0400", "終了時刻を確認してください")
+            )
+        if start and end and start >= end:
+            field_errors.append(
+                FieldError(f"{field}.{index}.start", "E-0400", "開始時刻を確認してください")
+            )
+            field_errors.append(
+                FieldError(f"{field}.{index}.end", "E-0400", "終了時刻を確認してください")
+            )
+        if start and end and start < end:
+            working_slots.append((start, end))
+
+    working_slots.sort(key=lambda slot: slot[0])
+    for index in range(1, len(working_slots)):
+        previous_end = working_slots[index - 1][1]
+        current_start = working_slots[index][0]
+        if current_start <= previous_end:
+            field_errors.append(
+                FieldError(field, "E-0400", "時間帯が重複しています")
+            )
+            break
+
+    return working_slots
+
+
+def _validate_constraints(constraints: Constraints, field_errors: list[FieldError]) -> None:
+    if not (0 <= constraints.break_minutes <= 30):
+        field_errors.append(
+            FieldError("constraints.break_minutes", "E-0400", "0〜30で入力してください")
+        )
+    if not (30 <= constraints.focus_max_minutes <= 180):
+        field_errors.append(
+            FieldError("constraints.focus_max_minutes", "E-0400", "30〜180で入力してください")
+        )
+    if not (0.0 <= constraints.buffer_ratio <= 0.30):
+        field_errors.append(
+            FieldError("constraints.buffer_ratio", "E-0400", "0.00〜0.30で入力してください")
+        )
+
+
 def validate_task_request(request: TaskUpdateRequest) -> None:
     field_errors: list[FieldError] = []
     if request.priority is not None and not (1 <= request.priority <= 5):
@@ -47,6 +120,13 @@ def validate_task_request(request: TaskUpdateRequest) -> None:
             field_errors.append(
                 FieldError("min_block_minutes", "E-0400", "5〜180で入力してください")
             )
+    if request.candidate_assignees is not None:
+        if not (1 <= len(request.candidate_assignees) <= TEAM_MAX_MEMBERS):
+            field_errors.append(
+                FieldError(
+                    "candidate_assignees", "E-0400", f"1〜{TEAM_MAX_MEMBERS}件で入力してください"
+                )
+            )
     if field_errors:
         raise ApiError(
             status_code=400,
@@ -81,56 +161,94 @@ def normalize_plan_request(request: PlanGenerateRequest) -> tuple[list[tuple[tim
         field_errors.append(
             FieldError("timezone", "E-0400", "Asia/Tokyoのみ指定できます")
         )
-    if not (1 <= len(request.working_hours) <= 3):
+    working_slots = _normalize_working_hours(request.working_hours, field_errors)
+
+    constraints = request.constraints or Constraints()
+    _validate_constraints(constraints, field_errors)
+    if request.mode == "optimize" and not (
+        OPTIMIZE_MIN_BUDGET_MS <= request.budget_ms <= OPTIMIZE_MAX_BUDGET_MS
+    ):
         field_errors.append(
-            FieldError("working_hours", "E-0400", "1〜3件で入力してください")
+            FieldError(
+                "budget_ms",
+                "E-0400",
+                f"{OPTIMIZE_MIN_BUDGET_MS}〜{OPTIMIZE_MAX_BUDGET_MS}で入力してください",
+            )
         )
 
-    working_slots: list[tuple[time, time]] = []
-    for index, slot in enumerate(request.working_hours):
-        start = _time_from_hhmm(slot.start)
-        end = _time_from_hhmm(slot.end)
-        if start is None:
-            field_errors.append(
-                FieldError(f"working_hours.{index}.start", "E-0400", "開始時刻を確認してください")
-            )
-        if end is None:
-            field_errors.append(
-                FieldError(f"working_hours.{index}.end", "E-0400", "終了時刻を確認してください")
-            )
-        if start and end and start >= end:
-            field_errors.append(
-                FieldError(f"working_hours.{index}.start", "E-0400", "開始時刻を確認してください")
-            )
-            field_errors.append(
-                FieldError(f"working_hours.{index}.end", "E-0400", "終了時刻を確認してください")
-            )
-        if start and end and start < end:
-            working_slots.append((start, end))
+    if field_errors:
+        raise ApiError(
+            status_code=400,
+            message_id="E-0400",
+            message="入力内容が不正です",
+            field_errors=field_errors,
+        )
 
-    constraints = request.constraints or Constraints()
-    if not (0 <= constraints.break_minutes <= 30):
+    return working_slots, constraints
+
+
+def normalize_freebusy_request(
+    date_from: date,
+    date_to: date,
+    working_hours: str | None,
+) -> list[tuple[time, time]] | None:
+    field_errors: list[FieldError] = []
+    if date_from > date_to:
         field_errors.append(
-            FieldError("constraints.break_minutes", "E-0400", "0〜30で入力してください")
+            FieldError("from", "E-0400", "日付範囲を確認してください")
         )
-    if not (30 <= constraints.focus_max_minutes <= 180):
+    elif (date_to - date_from).days >= FREEBUSY_MAX_DAYS:
         field_errors.append(
-            FieldError("constraints.focus_max_minutes", "E-0400", "30〜180で入力してください")
+            FieldError("to", "E-0400", f"期間は{FREEBUSY_MAX_DAYS}日以内で入力してください")
         )
-    if not (0.0 <= constraints.buffer_ratio <= 0.30):
+
+    working_slots = None
+    if working_hours is not None:
+        parsed: list[WorkingHour] = []
+        for entry in working_hours.split(","):
+            start, _, end = entry.strip().partition("-")
+            parsed.append(WorkingHour(start=start, end=end))
+        working_slots = _normalize_working_hours(parsed, field_errors)
+
+    if field_errors:
+        raise ApiError(
+            status_code=400,
+            message_id="E-0400",
+            message="入力内容が不正です",
+            field_errors=field_errors,
+        )
+
+    return working_slots
+
+
+def normalize_team_plan_request(
+    request: TeamPlanGenerateRequest,
+) -> tuple[list[tuple[str, list[tuple[time, time]]]], Constraints]:
+    field_errors: list[FieldError] = []
+    if request.timezone != "Asia/Tokyo":
         field_errors.append(
-            FieldError("constraints.buffer_ratio", "E-0400", "0.00〜0.30で入力してください")
+            FieldError("timezone", "E-0400", "Asia/Tokyoのみ指定できます")
+        )
+    if not (1 <= len(request.members) <= TEAM_MAX_MEMBERS):
+        field_errors.append(
+            FieldError("members", "E-0400", f"1〜{TEAM_MAX_MEMBERS}件で入力してください")
         )
 
-    working_slots.sort(key=lambda slot: slot[0])
-    for index in range(1, len(working_slots)):
-        previous_end = working_slots[index - 1][1]
-        current_start = working_slots[index][0]
-        if current_start <= previous_end:
+    members: list[tuple[str, list[tuple[time, time]]]] = []
+    seen: set[str] = set()
+    for index, member in enumerate(request.members):
+        if member.member_id in seen:
             field_errors.append(
-                FieldError("working_hours", "E-0400", "時間帯が重複しています")
+                FieldError(f"members.{index}.member_id", "E-0400", "メンバーが重複しています")
             )
-            break
+        seen.add(member.member_id)
+        working_slots = _normalize_working_hours(
+            member.working_hours, field_errors, f"members.{index}.working_hours"
+        )
+        members.append((member.member_id, working_slots))
+
+    constraints = request.constraints or Constraints()
+    _validate_constraints(constraints, field_errors)
 
     if field_errors:
         raise ApiError(
@@ -140,4 +258,4 @@ def normalize_plan_request(request: PlanGenerateRequest) -> tuple[list[tuple[tim
             field_errors=field_errors,
         )
 
-    return working_slots, constraints
+    return members, constraints
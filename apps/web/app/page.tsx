@@ -1,6 +1,6 @@
 "use client";
 
-import { useCallback, useEffect, useMemo, useState } from "react";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 
 const apiBase =
   process.env.NEXT_PUBLIC_API_BASE?.replace(/\/$/, "") ?? "http://localhost:8000";
@@ -34,6 +34,22 @@ type PlanBlock = {
   task_title: string | null;
 };
 
+type ChangeRecord = {
+  seq: number;
+  entity: "task" | "event" | "plan";
+  id: string;
+  op: "create" | "update" | "delete";
+  version: number;
+};
+
+type DayView = {
+  date: string;
+  tasks: Task[];
+  events: EventItem[];
+  plan: PlanListItem | null;
+  blocks: PlanBlock[] | null;
+};
+
 type WarningItem = {
   message_id: string;
   message: string;
@@ -64,6 +80,16 @@ async function fetchJson<T>(path: string, options?: RequestInit): Promise<T> {
   return payload as T;
 }
 
+function upsert<T>(items: T[], item: T, key: (item: T) => string) {
+  const index = items.findIndex((current) => key(current) === key(item));
+  if (index === -1) return [...items, item];
+  return items.map((current, i) => (i === index ? item : current));
+}
+
+function localDate(value: string, timezone: string) {
+  return new Date(value).toLocaleDateString("sv-SE", { timeZone: timezone });
+}
+
 function formatTime(value: string) {
   if (!value) return "";
   if (/^\d{2}:\d{2}$/.test(value)) return value;
@@ -612,7 +638,6 @@ function EventList({ events }: { events: EventItem[] }) {
 export default function Home() {
   const [tasks, setTasks] = useState<Task[]>([]);
   const [events, setEvents] = useState<EventItem[]>([]);
-  const [plans, setPlans] = useState<PlanListItem[]>([]);
   const [blocks, setBlocks] = useState<PlanBlock[]>([]);
   const [warnings, setWarnings] = useState<WarningItem[]>([]);
   const [overflows, setOverflows] = useState<OverflowItem[]>([]);
@@ -643,44 +668,75 @@ export default function Home() {
     ],
   });
 
-  const refreshTasks = useCallback(async () => {
-    const payload = await fetchJson<{ data: Task[] }>("/tasks");
-    setTasks(payload.data);
-  }, []);
+  // 変更フィードの購読開始位置。最初の日ビュー取得時の last_event_id。
+  const [feedCursor, setFeedCursor] = useState<string | null>(null);
 
-  const refreshEvents = useCallback(async () => {
-    const payload = await fetchJson<{ data: EventItem[] }>(
-      `/events?date=${planForm.date}`
+  // 表示中の日付の未完了タスク・予定・最新計画を /days/{date} でまとめて取得する。
+  const loadDay = useCallback(async () => {
+    const payload = await fetchJson<{ data: DayView; meta: { last_event_id: string } }>(
+      `/days/${planForm.date}`
     );
-    setEvents(payload.data);
+    setTasks(payload.data.tasks);
+    setEvents(payload.data.events);
+    setBlocks(payload.data.blocks ?? []);
+    return payload.meta.last_event_id;
   }, [planForm.date]);
 
-  const refreshPlans = useCallback(async () => {
-    const payload = await fetchJson<{ data: PlanListItem[] }>("/plans");
-    setPlans(payload.data);
-  }, []);
-
-  const loadLatestPlanBlocks = useCallback(async () => {
-    if (plans.length === 0) {
-      setBlocks([]);
+  useEffect(() => {
+    loadDay()
+      .then((cursor) => setFeedCursor((prev) => prev ?? cursor))
+      .catch((err) => setError(err.message));
+  }, [loadDay]);
+
+  // 変更フィード（/changes）を日ビュー取得時点から購読し、タスク・予定は変更のあった
+  // 1 件だけを取り直す。計画の変更と、追従できない場合（reset）は日ビューを取り直す。
+  const applyChange = async (change: ChangeRecord | null) => {
+    if (change === null || change.entity === "plan") {
+      await loadDay();
       return;
     }
-    const latest = plans[plans.length - 1];
-    const payload = await fetchJson<{ data: PlanBlock[] }>(
-      `/plans/${latest.plan_id}/blocks`
-    );
-    setBlocks(payload.data);
-  }, [plans]);
-
-  useEffect(() => {
-    refreshTasks().catch((err) => setError(err.message));
-    refreshEvents().catch((err) => setError(err.message));
-    refreshPlans().catch((err) => setError(err.message));
-  }, [refreshEvents, refreshPlans, refreshTasks]);
+    const { entity, id, op } = change;
+    if (entity === "task") {
+      if (op === "delete") {
+        setTasks((prev) => prev.filter((task) => task.task_id !== id));
+        return;
+      }
+      const payload = await fetchJson<{ data: Task }>(`/tasks/${id}`);
+      setTasks((prev) =>
+        payload.data.status === "open"
+          ? upsert(prev, payload.data, (task) => task.task_id)
+          : prev.filter((task) => task.task_id !== id)
+      );
+    } else {
+      if (op === "delete") {
+        setEvents((prev) => prev.filter((event) => event.event_id !== id));
+        return;
+      }
+      const payload = await fetchJson<{ data: EventItem }>(`/events/${id}`);
+      setEvents((prev) =>
+        localDate(payload.data.start_at, planForm.timezone) === planForm.date
+          ? upsert(prev, payload.data, (event) => event.event_id)
+          : prev.filter((event) => event.event_id !== id)
+      );
+    }
+  };
+  const applyChangeRef = useRef(applyChange);
+  applyChangeRef.current = applyChange;
 
   useEffect(() => {
-    loadLatestPlanBlocks().catch((err) => setError(err.message));
-  }, [loadLatestPlanBlocks]);
+    if (feedCursor === null) {
+      return;
+    }
+    const source = new EventSource(`${apiBase}/changes?after=${encodeURIComponent(feedCursor)}`);
+    const handle = (change: ChangeRecord | null) => {
+      applyChangeRef.current(change).catch((err) => setError(err.message));
+    };
+    source.addEventListener("change", (message) => {
+      handle(JSON.parse((message as MessageEvent).data) as ChangeRecord);
+    });
+    source.addEventListener("reset", () => handle(null));
+    return () => source.close();
+  }, [feedCursor]);
 
   const handleCreateTask = async () => {
     setError(null);
@@ -691,7 +747,6 @@ export default function Home() {
         body: JSON.stringify(taskForm),
       });
       setTaskForm((prev) => ({ ...prev, title: "", description: "" }));
-      await refreshTasks();
     } catch (err) {
       setError(err instanceof Error ? err.message : "タスクの作成に失敗しました。");
     } finally {
@@ -711,13 +766,7 @@ export default function Home() {
       // 作成した予定の日付を抽出
       const eventDate = eventForm.start_at.slice(0, 10);
 
-      // その日付のイベント一覧を取得
-      const payload = await fetchJson<{ data: EventItem[] }>(
-        `/events?date=${eventDate}`
-      );
-      setEvents(payload.data);
-
-      // planForm.date も更新（作成した予定の日付に切り替え）
+      // planForm.date も更新（作成した予定の日付に切り替え、日ビューを取り直す）
       if (eventDate !== planForm.date) {
         setPlanForm(prev => ({ ...prev, date: eventDate }));
       }
@@ -747,7 +796,6 @@ export default function Home() {
       setBlocks(payload.data.blocks);
       setWarnings(payload.data.warnings);
       setOverflows(payload.data.overflow);
-      await refreshPlans();
     } catch (err) {
       setError(err instanceof Error ? err.message : "計画の生成に失敗しました。");
     } finally {
@@ -0,0 +1,245 @@
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from apps.api import durability, main
+from apps.api.durability import Journal
+from apps.api.schemas import Task
+from apps.api.storage import InMemoryStore
+
+BASE = datetime(2026, 1, 5, 9, 0, tzinfo=timezone(timedelta(hours=9)))
+
+
+def make_task(task_id: str, tenant_id: str = "acme", title: str = "設計書作成") -> Task:
+    return Task(
+        task_id=task_id,
+        tenant_id=tenant_id,
+        title=title,
+        type="task",
+        priority=3,
+        estimate_minutes=60,
+        status="open",
+        due_at=BASE + timedelta(days=1),
+        created_at=BASE,
+        updated_at=BASE,
+    )
+
+
+def open_journal(data_dir) -> tuple[InMemoryStore, Journal]:
+    store = InMemoryStore()
+    journal = Journal(store, str(data_dir), 3600)
+    journal.open()
+    return store, journal
+
+
+def put(store: InMemoryStore, journal: Journal, task: Task) -> None:
+    store.tasks[task.task_id] = task
+    journal.record("task", task.task_id)
+
+
+def delete(store: InMemoryStore, journal: Journal, task_id: str) -> None:
+    store.tasks.pop(task_id)
+    journal.record("task", task_id)
+
+
+def segments(data_dir) -> list[str]:
+    return sorted(path.name for path in data_dir.glob("wal-*.log"))
+
+
+def test_wal_replay_restores_puts_and_deletes(tmp_path) -> None:
+    store, journal = open_journal(tmp_path)
+    put(store, journal, make_task("t1"))
+    put(store, journal, make_task("t2", tenant_id="globex"))
+    put(store, journal, make_task("t1", title="レビュー"))
+    delete(store, journal, "t2")
+    journal.close()
+
+    store, journal = open_journal(tmp_path)
+    try:
+        assert store.tasks["t1"].title == "レビュー"
+        assert "t2" not in store.tasks
+        assert [task.task_id for task in store.tasks.lookup("acme", "open")] == ["t1"]
+    finally:
+        journal.close()
+
+
+def test_torn_tail_is_truncated(tmp_path) -> None:
+    store, journal = open_journal(tmp_path)
+    put(store, journal, make_task("t1"))
+    journal.close()
+    segment = tmp_path / segments(tmp_path)[-1]
+    size = segment.stat().st_size
+    with open(segment, "ab") as file:
+        file.write(struct.pack("<IIB", 100, 0, 0) + b'{"task_id"')
+
+    store, journal = open_journal(tmp_path)
+    try:
+        assert list(store.tasks) == ["t1"]
+        assert segment.stat().st_size == size
+        put(store, journal, make_task("t2"))
+    finally:
+        journal.close()
+
+    store, journal = open_journal(tmp_path)
+    try:
+        assert sorted(store.tasks) == ["t1", "t2"]
+    finally:
+        journal.close()
+
+
+def test_snapshot_rotates_segments(tmp_path) -> None:
+    store, journal = open_journal(tmp_path)
+    put(store, journal, make_task("t1"))
+    assert segments(tmp_path) == ["wal-0000000000.log"]
+    journal.snapshot()
+    assert segments(tmp_path) == ["wal-0000000001.log"]
+    put(store, journal, make_task("t2", tenant_id="globex"))
+    journal.close()
+
+    store, journal = open_journal(tmp_path)
+    try:
+        store.load_all()
+        assert sorted(store.tasks) == ["t1", "t2"]
+        assert store.tasks["t1"] == make_task("t1")
+        assert segments(tmp_path) == ["wal-0000000001.log"]
+    finally:
+        journal.close()
+
+
+def test_replay_over_overlapping_snapshot(tmp_path) -> None:
+    store, journal = open_journal(tmp_path)
+    put(store, journal, make_task("t1"))
+    put(store, journal, make_task("t2"))
+    put(store, journal, make_task("t3", tenant_id="globex"))
+    journal.snapshot()
+    # Frames for states the snapshot already holds replay to the same result.
+    journal.record("task", "t1")
+    put(store, journal, make_task("t2", title="レビュー"))
+    delete(store, journal, "t3")
+    journal.close()
+
+    store, journal = open_journal(tmp_path)
+    try:
+        assert [task.title for task in store.tasks.lookup("acme", "open")] == ["設計書作成", "レビュー"]
+        store.load_all()
+        assert sorted(store.tasks) == ["t1", "t2"]
+        assert store.tasks.partition("globex") == {}
+    finally:
+        journal.close()
+
+
+def test_snapshot_rows_get_defaults_for_new_fields(tmp_path) -> None:
+    store, journal = open_journal(tmp_path)
+    put(store, journal, make_task("t1"))
+    journal.snapshot()
+    journal.close()
+
+    path = tmp_path / "snapshot.bin"
+    data = path.read_bytes()
+    offset = durability._SNAPSHOT_HEADER.size
+    (size,) = durability._SECTION.unpack_from(data, offset)
+    start = offset + durability._SECTION.size
+    rows = []
+    for tenant_id, payload in durability._decode_partitions(memoryview(data[start : start + size])):
+        values = json.loads(payload)
+        for row in values:
+            del row["splittable"]
+        rows.append((tenant_id, json.dumps(values).encode()))
+    section = b"".join(
+        durability._PARTITION.pack(len(tenant_id.encode()), len(payload)) + tenant_id.encode() + payload
+        for tenant_id, payload in rows
+    )
+    path.write_bytes(data[:offset] + durability._SECTION.pack(len(section)) + section + data[start + size :])
+
+    store, journal = open_journal(tmp_path)
+    try:
+        store.load_all()
+        assert store.tasks["t1"].splittable is True
+        assert store.tasks["t1"].due_at == BASE + timedelta(days=1)
+    finally:
+        journal.close()
+
+
+def test_unknown_snapshot_version_is_rejected(tmp_path) -> None:
+    store, journal = open_journal(tmp_path)
+    put(store, journal, make_task("t1"))
+    journal.snapshot()
+    journal.close()
+    path = tmp_path / "snapshot.bin"
+    path.write_bytes(b"LLTSNAP2" + path.read_bytes()[8:])
+
+    with pytest.raises(ValueError, match="unsupported snapshot version"):
+        Journal(InMemoryStore(), str(tmp_path), 3600).open()
+
+
+def test_failed_journal_write_rolls_back(tmp_path, monkeypatch) -> None:
+    store, journal = open_journal(tmp_path)
+    monkeypatch.setattr(main, "STORE", store)
+    monkeypatch.setattr(main, "JOURNAL", journal)
+    client = TestClient(main.app, headers={"X-Tenant-ID": "rollback"})
+    try:
+        response = client.post(
+            "/tasks", json={"title": "設計書作成", "type": "task", "priority": 3, "estimate_minutes": 60}
+        )
+        assert response.status_code == 201
+        task_id = response.json()["data"]["task_id"]
+
+        def fail(_):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(durability.os, "fsync", fail)
+        response = client.patch(f"/tasks/{task_id}", json={"title": "レビュー"})
+        assert response.status_code == 500
+        response = client.post(
+            "/tasks", json={"title": "議事録", "type": "task", "priority": 3, "estimate_minutes": 30}
+        )
+        assert response.status_code == 500
+        monkeypatch.undo()
+        assert [task.title for task in store.tasks.values()] == ["設計書作成"]
+    finally:
+        journal.close()
+
+
+def test_data_directory_is_locked_while_open(tmp_path) -> None:
+    _, journal = open_journal(tmp_path)
+    try:
+        with pytest.raises(RuntimeError, match="in use"):
+            Journal(InMemoryStore(), str(tmp_path), 3600).open()
+    finally:
+        journal.close()
+    _, journal = open_journal(tmp_path)
+    journal.close()
+
+
+def test_blocks_keep_the_title_of_a_deleted_task(tmp_path, monkeypatch) -> None:
+    store, journal = open_journal(tmp_path)
+    monkeypatch.setattr(main, "STORE", store)
+    monkeypatch.setattr(main, "JOURNAL", journal)
+    client = TestClient(main.app, headers={"X-Tenant-ID": "deleted-task"})
+    try:
+        response = client.post(
+            "/tasks", json={"title": "設計書作成", "type": "task", "priority": 3, "estimate_minutes": 60}
+        )
+        task_id = response.json()["data"]["task_id"]
+        response = client.post(
+            "/plans/generate",
+            json={"date": "2026-01-11", "timezone": "Asia/Tokyo", "working_hours": [{"start": "09:00", "end": "18:00"}]},
+        )
+        plan_id = response.json()["data"]["plan"]["plan_id"]
+        assert client.delete(f"/tasks/{task_id}").status_code == 200
+        journal.snapshot()
+    finally:
+        monkeypatch.undo()
+        journal.close()
+
+    store, journal = open_journal(tmp_path)
+    try:
+        titles = [block.task_title for block in store.plan_blocks.get(plan_id) if block.kind == "work"]
+        assert titles == ["設計書作成"]
+        store.plan_blocks.pop(plan_id)
+        assert store.plan_blocks.task_table() == [None]
+    finally:
+        journal.close()
@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+
+from apps.api.main import app
+
+
+def test_traced_plan_with_break_blocks() -> None:
+    client = TestClient(app, headers={"X-Tenant-ID": "trace-break"})
+    response = client.post(
+        "/tasks",
+        json={"title": "設計書作成", "type": "task", "priority": 3, "estimate_minutes": 150},
+    )
+    assert response.status_code == 201
+
+    response = client.post(
+        "/plans/generate",
+        json={
+            "date": "2026-01-11",
+            "timezone": "Asia/Tokyo",
+            "working_hours": [{"start": "09:00", "end": "18:00"}],
+            "trace": True,
+        },
+    )
+    assert response.status_code == 200
+    blocks = response.json()["data"]["blocks"]
+    assert any(block["kind"] == "break" for block in blocks)
+    for block in blocks:
+        if block["kind"] == "work":
+            assert block["meta"]["assigned_rule"] == "priority_first"
+        else:
+            assert "assigned_rule" not in block["meta"]
+
+    plan_id = response.json()["data"]["plan"]["plan_id"]
+    assert client.get(f"/plans/{plan_id}/trace").status_code == 200